@@ -167,53 +167,93 @@ Init_Gesture_Array = (
 )
 
 
+# gesture flag -> name, flag register 1 in the low byte, register 2 in the high byte
+GESTURES = {
+    PAJ_UP: "Up",
+    PAJ_DOWN: "Down",
+    PAJ_LEFT: "Left",
+    PAJ_RIGHT: "Right",
+    PAJ_FORWARD: "Forward",
+    PAJ_BACKWARD: "Backward",
+    PAJ_CLOCKWISE: "Clockwise",
+    PAJ_COUNT_CLOCKWISE: "AntiClockwise",
+    PAJ_WAVE: "Wave",
+}
+# smbus block transfers carry at most 32 data bytes
+I2C_BLOCK_SIZE = 32
+
+
+def block_writes(register_array):
+    """
+    Groups (register, value) pairs into (start register, [values]) blocks of consecutive registers, the sensor
+    increments the register address itself within a transfer. A bank select always gets its own write.
+    """
+    blocks = []
+    for register, value in register_array:
+        if blocks and register != PAJ_BANK_SELECT and blocks[-1][0] != PAJ_BANK_SELECT \
+                and register == blocks[-1][0] + len(blocks[-1][1]) and len(blocks[-1][1]) < I2C_BLOCK_SIZE:
+            blocks[-1][1].append(value)
+        else:
+            blocks.append((register, [value]))
+    return blocks
+
+
+Init_Register_Blocks = block_writes(Init_Register_Array)
+Init_Gesture_Blocks = block_writes(Init_Gesture_Array)
+
+
 class PAJ7620U2(object):
     def __init__(self, address=PAJ7620U2_I2C_ADDRESS):
         self._address = address
         self._bus = smbus.SMBus(1)
-        time.sleep(0.5)
-        if self._read_byte(0x00) == 0x20:
+        if self._wake_up() == 0x20:
             print("\nGesture Sensor OK\n")
-            for num in range(len(Init_Register_Array)):
-                self._write_byte(Init_Register_Array[num][0], Init_Register_Array[num][1])
+            self._write_blocks(Init_Register_Blocks)
         else:
             print("\nGesture Sensor Error\n")
         self._write_byte(PAJ_BANK_SELECT, 0)
-        for num in range(len(Init_Gesture_Array)):
-            self._write_byte(Init_Gesture_Array[num][0], Init_Gesture_Array[num][1])
+        self._write_blocks(Init_Gesture_Blocks)
+
+    def _wake_up(self, timeout=0.5):
+        # the first access after power up only wakes the sensor (and may not be acked), it is ready ~700us later
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self._read_byte(0x00)
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.001)
 
     def _read_byte(self, cmd):
         return self._bus.read_byte_data(self._address, cmd)
 
     def _read_u16(self, cmd):
-        LSB = self._bus.read_byte_data(self._address, cmd)
-        MSB = self._bus.read_byte_data(self._address, cmd + 1)
+        LSB, MSB = self._bus.read_i2c_block_data(self._address, cmd, 2)
         return (MSB << 8) + LSB
 
     def _write_byte(self, cmd, val):
         self._bus.write_byte_data(self._address, cmd, val)
 
+    def _write_blocks(self, blocks):
+        for register, values in blocks:
+            if len(values) == 1:
+                self._write_byte(register, values[0])
+            else:
+                self._bus.write_i2c_block_data(self._address, register, values)
+
+    def read_flags(self):
+        """Raw gesture interrupt flags, reading them clears them on the sensor."""
+        return self._read_u16(PAJ_INT_FLAG1)
+
+    def read_events(self):
+        """All gestures flagged since the last read, as names. Usually one, fast movements can set several."""
+        flags = self.read_flags()
+        return [name for flag, name in GESTURES.items() if flags & flag]
+
     def get_gesture(self):
-        Gesture_Data = self._read_u16(PAJ_INT_FLAG1)
-        if Gesture_Data == PAJ_UP:
-            return "Up"
-        elif Gesture_Data == PAJ_DOWN:
-            return "Down"
-        elif Gesture_Data == PAJ_LEFT:
-            return "Left"
-        elif Gesture_Data == PAJ_RIGHT:
-            return "Right"
-        elif Gesture_Data == PAJ_FORWARD:
-            return "Forward"
-        elif Gesture_Data == PAJ_BACKWARD:
-            return "Backward"
-        elif Gesture_Data == PAJ_CLOCKWISE:
-            return "Clockwise"
-        elif Gesture_Data == PAJ_COUNT_CLOCKWISE:
-            return "AntiClockwise"
-        elif Gesture_Data == PAJ_WAVE:
-            return "Wave"
-        return Gesture_Data
+        Gesture_Data = self.read_flags()
+        return GESTURES.get(Gesture_Data, Gesture_Data)
 
 
 if __name__ == '__main__':
@@ -226,10 +266,5 @@ if __name__ == '__main__':
 
     while True:
         time.sleep(0.05)
-        paj7620u2.check_gesture()
-
-
-
-
-
-
+        for gesture in paj7620u2.read_events():
+            print(gesture)
@@ -0,0 +1,151 @@
+import math
+import threading
+import time
+
+import numpy as np
+
+
+class Animation:
+    """
+    `frame_count` frames shown at `fps`. render(index, out) draws frame `index` with numpy into `out`, an uint8
+    array (height, width, 3) handed in by the player, everything else is precomputed once in setup().
+    """
+
+    def __init__(self, frame_count, fps):
+        self.frame_count = frame_count
+        self.fps = fps
+
+    def setup(self, width, height):
+        pass
+
+    def render(self, index, out):
+        raise NotImplementedError
+
+
+class ColorFlash(Animation):
+    def __init__(self, colors=(((255, 255, 255), 5), ((255, 0, 0), 1), ((0, 255, 0), 1), ((0, 0, 255), 1)), fps=10):
+        # colors: (color, number of frames)
+        super().__init__(sum(frames for _, frames in colors), fps)
+        self.frame_colors = np.array([color for color, frames in colors for _ in range(frames)], dtype=np.uint8)
+
+    def render(self, index, out):
+        out[...] = self.frame_colors[index]
+
+
+class GrowingCircle(Animation):
+    """A filled circle with outline growing from the center until it covers the screen."""
+
+    def __init__(self, frame_count=15, fps=15, fill=(255, 255, 255), outline=(255, 0, 0), outline_width=3,
+                 background=(0, 0, 255)):
+        super().__init__(frame_count, fps)
+        self.fill = np.array(fill, dtype=np.uint8)
+        self.outline = np.array(outline, dtype=np.uint8)
+        self.outline_width = outline_width
+        self.background = np.array(background, dtype=np.uint8)
+
+    def setup(self, width, height):
+        y, x = np.ogrid[:height, :width]
+        # distance of every pixel to the center, each frame is then only two comparisons with the radius
+        self.distance = np.sqrt((x - width / 2) ** 2 + (y - height / 2) ** 2).astype(np.float32)
+        self.inside = np.empty((height, width, 1), dtype=bool)
+        self.ring = np.empty((height, width, 1), dtype=bool)
+        self.radii = np.geomspace(10, math.hypot(width, height) / 2, self.frame_count).astype(np.float32)
+
+    def render(self, index, out):
+        radius = self.radii[index]
+        out[...] = self.background
+        np.less_equal(self.distance[..., None], radius, out=self.inside)
+        np.copyto(out, self.fill, where=self.inside)
+        np.greater(self.distance[..., None], radius - self.outline_width, out=self.ring)
+        self.ring &= self.inside
+        np.copyto(out, self.outline, where=self.ring)
+
+
+class SineWave(Animation):
+    """Moving vertical gray stripes: one sine profile over the columns per frame, broadcast over all rows."""
+
+    def __init__(self, frame_count=50, fps=20):
+        super().__init__(frame_count, fps)
+
+    def setup(self, width, height):
+        self.columns = np.arange(width, dtype=np.float32)
+        # same stripe width as the old screensaver: sin((i + j) / (12 pi / 240))
+        self.frequency = np.float32(240 / (12 * math.pi))
+        self.profile = np.empty(width, dtype=np.float32)
+        self.brightness = np.empty(width, dtype=np.uint8)
+
+    def render(self, index, out):
+        np.add(self.columns, index, out=self.profile)
+        self.profile *= self.frequency
+        np.sin(self.profile, out=self.profile)
+        self.profile += 1
+        self.profile *= 255 / 4
+        np.copyto(self.brightness, self.profile, casting="unsafe")
+        out[...] = self.brightness[None, :, None]
+
+
+def default_screensaver():
+    return [ColorFlash(), GrowingCircle(), SineWave()]
+
+
+class AnimationPlayer:
+    """
+    Plays animations full screen through the screen's display writer. Frames are rendered into three reusable
+    buffers (one on the way to the display, one waiting, one being rendered) and paced to the animation's fps.
+    interrupt(), e.g. on a gesture, ends playback before the next frame.
+    """
+
+    def __init__(self, screen, animations):
+        self.screen = screen
+        self.animations = animations
+        width, height = screen.image.size
+        for animation in animations:
+            animation.setup(width, height)
+        self.buffers = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(3)]
+        self.interrupted = threading.Event()
+        self.playing = False
+
+    def interrupt(self):
+        self.interrupted.set()
+
+    def play(self):
+        """Returns True if all animations were shown, False if interrupted."""
+        self.interrupted.clear()
+        self.playing = True
+        frame = 0
+        try:
+            for animation in self.animations:
+                interval = 1 / animation.fps
+                next_frame = time.perf_counter()
+                for index in range(animation.frame_count):
+                    if self.interrupted.is_set():
+                        return False
+                    out = self.buffers[frame % len(self.buffers)]
+                    frame += 1
+                    animation.render(index, out)
+                    self.screen.submit_frame(out)
+                    next_frame += interval
+                    remaining = next_frame - time.perf_counter()
+                    if remaining > 0 and self.interrupted.wait(remaining):
+                        return False
+            return True
+        finally:
+            self.playing = False
+            # the page has to be sent completely again afterwards
+            self.screen.invalidate()
+
+
+class BurnInProtection:
+    """Plays `player` every `interval` seconds of screen time, checked by Screen.main_loop between frames."""
+
+    def __init__(self, player, interval=3600):
+        self.player = player
+        self.interval = interval
+        self.last_run = time.time()
+
+    def due(self):
+        return time.time() - self.last_run >= self.interval
+
+    def run(self):
+        self.player.play()
+        self.last_run = time.time()
@@ -0,0 +1,205 @@
+"""
+Benchmarks for the render, plot and persistence hot paths, running on the simulated hardware backends.
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json   # exits with 1 if a p50 got slower than the tolerance allows
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from hardware import NullDisplay, SimulatedCO2Sensor, SimulatedDHTSensor, SimulatedGestureSensor
+from animation import default_screensaver
+from channels import CO2, TEMPERATURE, HUMIDITY
+from screens import FULL_SCREEN_BOX, Screen, ChannelPage
+from tasks import Task, PingReaderTask, PlotBuilderTask, GestureReaderTask, create_sensor_sources
+
+HISTORY_SIZES = [100, 1000, 10000, 100000, 1000000]
+SAMPLE_INTERVAL = 5
+CHANNELS = [CO2, TEMPERATURE, HUMIDITY]
+
+
+def measure(function, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        "repeat": repeat,
+        "mean_ms": float(np.mean(timings)),
+        "min_ms": float(np.min(timings)),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "max_ms": float(np.max(timings)),
+    }
+
+
+def fill_history(task, size):
+    # synthetic history ending now, written in bulk like a long running device would have it: log and ring agree,
+    # so the next start of the task goes through the verification of the ring instead of a rebuild
+    timestamps = (int(time.time()) - SAMPLE_INTERVAL * np.arange(size)[::-1]).astype(np.uint32)
+    values = (800 + 300 * np.sin(np.arange(size) / 500)).astype(np.float32)
+    task.measurement_log.extend(zip(timestamps.tolist(), values.tolist()))
+    task.rolling_measurement_storage.extend_arrays(timestamps, values)
+    task.rolling_measurement_storage.flush()
+    task.aggregates.rebuild(task.rolling_measurement_storage.timestamps(),
+                            task.rolling_measurement_storage.values())
+
+
+def history_task(name, size):
+    return Task(retention=size * SAMPLE_INTERVAL, name=name, sleep_time=SAMPLE_INTERVAL)
+
+
+def bench_plot_build(screen, sizes, repeat):
+    results = {}
+    for size in sizes:
+        reader = history_task(f"bench_plot_{size}", size)
+        fill_history(reader, size)
+        plot_builder = PlotBuilderTask(retention=0, reader_task=reader, screen=screen)
+        results[f"plot_build/{size}"] = measure(plot_builder.read, repeat)
+    return results
+
+
+def bench_startup_load(sizes, repeat):
+    results = {}
+    for size in sizes:
+        fill_history(history_task(f"bench_load_{size}", size), size)
+        results[f"startup_load/{size}"] = measure(lambda: history_task(f"bench_load_{size}", size), repeat)
+    return results
+
+
+def bench_save_measurement(repeat):
+    co2_source, _ = create_sensor_sources(SimulatedCO2Sensor(), SimulatedDHTSensor())
+    task = co2_source.tasks["co2"]
+    return {
+        "save_measurement": measure(lambda: task.save_measurement(812.0), repeat),
+        # sensor read, pipeline stages and storage of both channels
+        "source_read/dht22": measure(create_sensor_sources(SimulatedCO2Sensor(), SimulatedDHTSensor())[1].read,
+                                     repeat),
+    }
+
+
+def bench_frame_conversion(screen, repeat):
+    # RGB888 -> RGB565 of a full frame on the display writer
+    pixels = screen.display_pixels(FULL_SCREEN_BOX)
+    return {"rgb565_full_frame": measure(lambda: screen.writer.write(0, 0, pixels), repeat)}
+
+
+def bench_screensaver(screen, repeat):
+    results = {}
+    buffer = np.zeros((screen.image.size[1], screen.image.size[0], 3), dtype=np.uint8)
+    for animation in default_screensaver():
+        animation.setup(*screen.image.size)
+        index = animation.frame_count // 2
+        results[f"screensaver_frame/{type(animation).__name__}"] = measure(lambda: animation.render(index, buffer),
+                                                                          repeat)
+    return results
+
+
+def bench_gesture_poll(screen, repeat):
+    task = GestureReaderTask(retention=0, screen=screen, sensor=SimulatedGestureSensor())
+    return {"gesture_poll": measure(task.read, repeat)}
+
+
+def bench_pages(screen, repeat):
+    tasks = {"ping": PingReaderTask(retention=0)}
+    for source in create_sensor_sources(SimulatedCO2Sensor(), SimulatedDHTSensor()):
+        for channel in source.channels:
+            fill_history(source.tasks[channel.name], 10000)
+        source.pipeline.warmup[:] = 0
+        source.read()
+        tasks.update(source.tasks)
+    for channel in CHANNELS:
+        tasks["plot_" + channel.name] = PlotBuilderTask(retention=0, reader_task=tasks[channel.name], screen=screen)
+        tasks["plot_" + channel.name].read()
+
+    results = {}
+    for channel in CHANNELS:
+        page = ChannelPage(screen, tasks, channel, [other for other in CHANNELS if other is not channel])
+        # full frame after a page change, then a frame where nothing changed
+        results[f"draw_frame/{channel.name}/full"] = measure(page.draw_frame, repeat, setup=screen.invalidate)
+        results[f"draw_frame/{channel.name}/unchanged"] = measure(page.draw_frame, repeat)
+    return results
+
+
+def run(quick=False):
+    sizes = HISTORY_SIZES[:3] if quick else HISTORY_SIZES
+    repeat = 20 if quick else 100
+    screen = Screen(disp=NullDisplay())
+    results = {}
+    results.update(bench_plot_build(screen, sizes, repeat))
+    results.update(bench_startup_load(sizes, max(repeat // 10, 5)))
+    results.update(bench_pages(screen, repeat))
+    results.update(bench_save_measurement(repeat * 10))
+    results.update(bench_gesture_poll(screen, repeat * 10))
+    screen.writer.wait_idle()
+    results.update(bench_frame_conversion(screen, repeat))
+    results.update(bench_screensaver(screen, repeat))
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Returns the names of all benchmarks whose p50 is more than `tolerance` times the baseline p50."""
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["p50_ms"], result["p50_ms"]
+        ratio = after / before if before > 0 else 1
+        marker = "REGRESSION" if ratio > tolerance else ""
+        print(f"{name:45s} {before:10.3f} ms -> {after:10.3f} ms  x{ratio:5.2f} {marker}")
+        if ratio > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed p50 slowdown factor (default 1.25)")
+    parser.add_argument("--quick", action="store_true", help="smaller history sizes and fewer repetitions")
+    args = parser.parse_args()
+
+    # tasks write their storage files into the working directory, keep them away from real data
+    work_dir = tempfile.mkdtemp(prefix="co2_benchmark_")
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        report = run(quick=args.quick)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import numpy as np
+
+GREEN = (95, 255, 66)
+YELLOW = (255, 238, 56)
+RED = (255, 69, 56)
+
+
+class Channel:
+    """
+    Declarative description of one measured quantity: how its values are filtered, how long they are kept and
+    how the page shows them. Adding a sensor channel means adding one of these, not new task or page classes.
+
+    warmup: number of values after startup that are shown but not stored (sensors need a few reads to settle)
+    smoothing: stored value is the mean of the last `smoothing` valid values, 1 disables it
+    color_stops: ((upper limit, color), ...) for the bar above the value, the first limit above the value wins
+    trend_window: seconds covered by the slope, min and max of the signal stage (dsp.StreamStats)
+    flat_slope: slope per minute below which the trend is shown as flat
+    """
+
+    def __init__(self, name, title, unit, label, digits=1, warmup=5, smoothing=1, retention=24 * 3600,
+                 color_stops=((None, GREEN),), trend_window=600, flat_slope=0.1, spike_sigma=4):
+        # name is also the name of the task and of its storage files
+        self.name = name
+        self.title = title
+        self.unit = unit
+        self.label = label
+        self.digits = digits
+        self.warmup = warmup
+        self.smoothing = smoothing
+        self.retention = retention
+        self.color_stops = color_stops
+        self.trend_window = trend_window
+        self.flat_slope = flat_slope
+        self.spike_sigma = spike_sigma
+
+    def color(self, value):
+        if value is None:
+            return (128, 128, 128)
+        for limit, color in self.color_stops:
+            if limit is None or value < limit:
+                return color
+        return self.color_stops[-1][1]
+
+
+CO2 = Channel("co2", "ppm CO2", "ppm", "co2", digits=0,
+              color_stops=((1000, GREEN), (1400, YELLOW), (None, RED)), flat_slope=3)
+TEMPERATURE = Channel("temp", "°C temperature", "°C", "t", flat_slope=0.02)
+HUMIDITY = Channel("humid", "% humidity (relative)", "%", "h")
+
+
+class ChannelPipeline:
+    """
+    The shared stages between a sensor read and storage for all channels of one source: missing values become
+    nan, then warmup discard, smoothing and rounding, each one numpy operation over the whole read.
+    """
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.warmup = np.array([channel.warmup for channel in channels], dtype=np.int64)
+        self.smoothing = np.array([channel.smoothing for channel in channels], dtype=np.int64)
+        self.scale = 10.0 ** np.array([channel.digits for channel in channels])
+        # ring of the last reads, one row per read
+        self.history = np.full((int(self.smoothing.max()), len(channels)), np.nan)
+        self.position = 0
+
+    def process(self, values):
+        """Returns (values, store) for one read, store tells per channel if the value is past the warmup."""
+        values = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        store = self.warmup <= 0
+        self.warmup = np.maximum(self.warmup - 1, 0)
+
+        window = len(self.history)
+        self.history[self.position % window] = values
+        self.position += 1
+        # age of every row in reads, the newest row has age 0
+        ages = (self.position - 1 - np.arange(window)) % window
+        in_window = (ages[:, None] < self.smoothing[None, :]) & ~np.isnan(self.history)
+        counts = in_window.sum(axis=0)
+        sums = np.where(in_window, self.history, 0).sum(axis=0)
+        # a missing read stays missing instead of repeating the mean of older values
+        smoothed = np.where(np.isnan(values) | (counts == 0), np.nan, sums / np.maximum(counts, 1))
+        return np.round(smoothed * self.scale) / self.scale, store
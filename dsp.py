@@ -0,0 +1,122 @@
+import math
+from collections import deque
+
+
+class StreamStats:
+    """
+    Incremental signal stage of one channel, every sample costs O(1) (amortized for min/max):
+
+    - exponential moving average and variance (`alpha` weight of the newest sample)
+    - least squares slope and min/max over the last `window` seconds, from running sums and monotonic queues
+    - a spike flag for samples more than `spike_sigma` standard deviations away from the average
+
+    Missing samples (nan) are skipped.
+    """
+
+    def __init__(self, window=600, alpha=0.2, spike_sigma=4, warmup=10):
+        self.window = window
+        self.alpha = alpha
+        self.spike_sigma = spike_sigma
+        # no spike flags until the average and variance have seen `warmup` samples
+        self.warmup = warmup
+        self.count = 0
+        self.ema = None
+        self.variance = 0.0
+        self.spike = False
+        self.spikes = 0
+        self.timestamp = None
+        # samples in the window and the sums of the least squares fit, times relative to origin for precision
+        self.samples = deque()
+        self.origin = None
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.0
+        # (timestamp, value) with increasing values resp. decreasing values, the front is the min resp. max
+        self.min_queue = deque()
+        self.max_queue = deque()
+
+    def update(self, value, timestamp):
+        if value is None or math.isnan(value):
+            return
+        self.count += 1
+        self.timestamp = timestamp
+        if self.ema is None:
+            self.ema = value
+        else:
+            difference = value - self.ema
+            self.spike = self.count > self.warmup and \
+                abs(difference) > self.spike_sigma * math.sqrt(self.variance) > 0
+            self.spikes += self.spike
+            increment = self.alpha * difference
+            self.ema += increment
+            self.variance = (1 - self.alpha) * (self.variance + difference * increment)
+
+        if self.origin is None or not self.samples:
+            self.origin = timestamp
+            self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.0
+        elif timestamp - self.origin > 4 * self.window:
+            self._rebase()
+        t = timestamp - self.origin
+        self.samples.append((t, value))
+        self.sum_t += t
+        self.sum_v += value
+        self.sum_tt += t * t
+        self.sum_tv += t * value
+        while self.min_queue and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((timestamp, value))
+        while self.max_queue and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((timestamp, value))
+
+        cutoff = timestamp - self.window
+        while self.samples[0][0] + self.origin < cutoff:
+            old_t, old_value = self.samples.popleft()
+            self.sum_t -= old_t
+            self.sum_v -= old_value
+            self.sum_tt -= old_t * old_t
+            self.sum_tv -= old_t * old_value
+        while self.min_queue[0][0] < cutoff:
+            self.min_queue.popleft()
+        while self.max_queue[0][0] < cutoff:
+            self.max_queue.popleft()
+
+    def _rebase(self):
+        # keeps the relative times small and clears the rounding errors the running sums collected,
+        # runs once every few windows, so it stays O(1) amortized
+        first = self.samples[0][0]
+        self.origin += first
+        self.samples = deque((t - first, value) for t, value in self.samples)
+        self.sum_t = sum(t for t, _ in self.samples)
+        self.sum_v = sum(value for _, value in self.samples)
+        self.sum_tt = sum(t * t for t, _ in self.samples)
+        self.sum_tv = sum(t * value for t, value in self.samples)
+
+    @property
+    def slope(self):
+        """Change per second over the window (least squares), None with less than two samples."""
+        n = len(self.samples)
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+    @property
+    def slope_per_minute(self):
+        slope = self.slope
+        return None if slope is None else slope * 60
+
+    @property
+    def minimum(self):
+        return self.min_queue[0][1] if self.min_queue else None
+
+    @property
+    def maximum(self):
+        return self.max_queue[0][1] if self.max_queue else None
+
+    def trend(self, flat_slope):
+        """1 rising, -1 falling, 0 flat (|slope| per minute below flat_slope) or None without enough samples."""
+        slope = self.slope_per_minute
+        if slope is None:
+            return None
+        if abs(slope) < flat_slope:
+            return 0
+        return 1 if slope > 0 else -1
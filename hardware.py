@@ -0,0 +1,309 @@
+import math
+import os
+import random
+import time
+
+import numpy as np
+from PIL import Image
+
+from resilience import CircuitBreaker
+
+# SIMULATED_HARDWARE=1 replaces every sensor and the display by the simulated backends below,
+# so the whole pipeline can run (and be profiled) on any Linux box
+SIMULATED = os.getenv("SIMULATED_HARDWARE") == "1"
+
+
+def _parse_field(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def load_trace(path):
+    """
+    Reads a trace file with one sample per line, values of a line separated by commas. Numbers become floats
+    (a tuple for several values), other values stay strings: a line like "Up" or "Up,Left" is a read of the gesture
+    sensor with one or several flagged gestures and becomes a list of names.
+    """
+    trace = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            values = [_parse_field(value.strip()) for value in line.split(",")]
+            if any(isinstance(value, str) for value in values):
+                trace.append(values)
+            else:
+                trace.append(values[0] if len(values) == 1 else tuple(values))
+    return trace
+
+
+class SimulatedDevice:
+    """
+    Deterministic base for simulated sensors: replays `trace` (cycling) or falls back to a generated signal,
+    sleeps `latency` seconds per read and fails with probability `failure_rate`, all seeded by `seed`.
+    """
+
+    def __init__(self, trace=None, latency=0.0, failure_rate=0.0, seed=0):
+        if isinstance(trace, str):
+            trace = load_trace(trace)
+        self.trace = trace
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.read_count = 0
+
+    def next_sample(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        index = self.read_count
+        self.read_count += 1
+        if self.random.random() < self.failure_rate:
+            return None
+        if self.trace:
+            return self.trace[index % len(self.trace)]
+        return self.generate(index)
+
+    def generate(self, index):
+        raise NotImplementedError
+
+
+class MHZ19Sensor:
+    def __init__(self):
+        import mh_z19
+        self.mh_z19 = mh_z19
+        # each path gets its own breaker, a dead serial line should not also make us wait on pwm every time
+        self.serial_breaker = CircuitBreaker("mh_z19_serial", failure_threshold=3)
+        self.pwm_breaker = CircuitBreaker("mh_z19_pwm", failure_threshold=3, reset_timeout=120)
+
+    @staticmethod
+    def _co2(result):
+        return result.get('co2') if isinstance(result, dict) else None
+
+    def read(self):
+        # returns the co2 concentration in ppm or None, the slower pwm read is the fallback if the serial read fails
+        if self.serial_breaker.allow():
+            try:
+                co2 = self._co2(self.mh_z19.read())
+            except (TypeError, OSError):
+                co2 = None
+            if co2 is not None:
+                self.serial_breaker.record_success()
+                return co2
+            self.serial_breaker.record_failure()
+        if self.pwm_breaker.allow():
+            try:
+                co2 = self._co2(self.mh_z19.read_from_pwm())
+            except (TypeError, OSError):
+                co2 = None
+            if co2 is not None:
+                self.pwm_breaker.record_success()
+                return co2
+            self.pwm_breaker.record_failure()
+        return None
+
+
+class SimulatedCO2Sensor(SimulatedDevice):
+    def generate(self, index):
+        # slow daily-like wave with some noise around 800 ppm
+        return int(800 + 300 * math.sin(index / 500) + self.random.gauss(0, 15))
+
+    def read(self):
+        return self.next_sample()
+
+
+def bcm_gpio():
+    # Blinka's `import board` sets BCM numbering as a side effect, but the acquisition process (MULTI_PROCESS=1)
+    # never imports it, so every backend that uses RPi.GPIO sets the mode itself
+    import RPi.GPIO as GPIO
+    GPIO.setmode(GPIO.BCM)
+    return GPIO
+
+
+class DHT22Sensor:
+    def __init__(self, pin=16):
+        import Adafruit_DHT
+        GPIO = bcm_gpio()
+        self.adafruit_dht = Adafruit_DHT
+        self.pin = pin
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    def read(self):
+        # (humidity, temperature) or None if the read failed. A single attempt, retries and the 2s pause the
+        # DHT22 needs between reads are up to the caller instead of read_retry's blocking 15 attempt loop
+        humidity, temperature = self.adafruit_dht.read(self.adafruit_dht.DHT22, self.pin)
+        if humidity is None or temperature is None:
+            return None
+        return humidity, temperature
+
+
+class SimulatedDHTSensor(SimulatedDevice):
+    def generate(self, index):
+        return 45 + 10 * math.sin(index / 700) + self.random.gauss(0, 0.5), \
+               21 + 2 * math.sin(index / 900) + self.random.gauss(0, 0.1)
+
+    def read(self):
+        return self.next_sample()
+
+
+class SimulatedGestureSensor(SimulatedDevice):
+    """Returns gesture names from the trace (e.g. ["Down", 0, 0, "Up", ["Up", "Left"]]) and 0 without one."""
+
+    def generate(self, index):
+        return 0
+
+    def get_gesture(self):
+        sample = self.next_sample()
+        return 0 if sample is None else sample
+
+    def read_events(self):
+        # a list in the trace stands for the gestures flagged in one read
+        sample = self.get_gesture()
+        if isinstance(sample, list):
+            return sample
+        return [sample] if isinstance(sample, str) else []
+
+
+class GPIOInterrupt:
+    """
+    Falling edge detection on `pin` through RPi.GPIO, e.g. for the active low INT output of the PAJ7620U2.
+    The callback runs in the event thread of RPi.GPIO.
+    """
+
+    def __init__(self, pin, bouncetime=5):
+        GPIO = bcm_gpio()
+        self.gpio = GPIO
+        self.pin = pin
+        self.bouncetime = bouncetime
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    def start(self, callback):
+        self.gpio.add_event_detect(self.pin, self.gpio.FALLING, callback=lambda _: callback(),
+                                   bouncetime=self.bouncetime)
+
+    def stop(self):
+        self.gpio.remove_event_detect(self.pin)
+
+
+class SimulatedSPI:
+    """Records what is written, with the same buffer check as Blinka's spi.write (an ndarray fails it)."""
+
+    def __init__(self):
+        self.last_write = None
+
+    def write(self, buf, start=0, end=None):
+        if not buf:
+            return
+        self.last_write = buf[start:end]
+
+
+class NullDisplay:
+    """
+    In-memory stand-in for the ST7789: keeps the framebuffer and counts what would have been sent over spi.
+    `seconds_per_byte` can simulate the transfer time (24 MHz spi, 2 bytes per pixel: ~0.33 us per byte).
+    """
+
+    def __init__(self, width=240, height=240, rotation=180, seconds_per_byte=0.0):
+        self.width = width
+        self.height = height
+        self.rotation = rotation
+        self.seconds_per_byte = seconds_per_byte
+        self.framebuffer = Image.new("RGB", (width, height))
+        self.spi = SimulatedSPI()
+        self.writes = 0
+        self.bytes_written = 0
+
+    def _transferred(self, byte_count):
+        self.writes += 1
+        self.bytes_written += byte_count
+        if self.seconds_per_byte > 0:
+            time.sleep(byte_count * self.seconds_per_byte)
+
+    def image(self, img, rotation=None, x=0, y=0):
+        if rotation is None:
+            rotation = self.rotation
+        if rotation != 0:
+            img = img.rotate(rotation, expand=True)
+        self.framebuffer.paste(img, (x, y))
+        self._transferred(img.size[0] * img.size[1] * 2)
+
+    def _block(self, x0, y0, x1, y1, data):
+        # same signature as the adafruit driver, the data goes through the spi write like on the device
+        self.spi.write(data)
+        self._decode(x0, y0, x1 - x0 + 1, y1 - y0 + 1, self.spi.last_write)
+
+    def write_block(self, x, y, width, height, data):
+        self._block(x, y, x + width - 1, y + height - 1, data)
+
+    def _decode(self, x, y, width, height, data):
+        # data: big endian RGB565 in display orientation, decoded back so framebuffer shows what the panel would
+        rgb565 = np.frombuffer(data, dtype=">u2").reshape(height, width).astype(np.uint16)
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        pixels[..., 0] = (rgb565 >> 11) << 3
+        pixels[..., 1] = ((rgb565 >> 5) & 0x3F) << 2
+        pixels[..., 2] = (rgb565 & 0x1F) << 3
+        self.framebuffer.paste(Image.fromarray(pixels, "RGB"), (x, y))
+        self._transferred(len(data))
+
+
+class ST7789Display:
+    """
+    The adafruit ST7789 driver plus write_block, which sends finished RGB565 data to a window of the panel
+    without the conversion in the driver's image().
+    """
+
+    def __init__(self, disp):
+        self.disp = disp
+        self.width = disp.width
+        self.height = disp.height
+        self.rotation = disp.rotation
+
+    def image(self, img, rotation=None, x=0, y=0):
+        self.disp.image(img, rotation, x, y)
+
+    def write_block(self, x, y, width, height, data):
+        self.disp._block(x, y, x + width - 1, y + height - 1, data)
+
+
+def create_st7789_display():
+    import board
+    import digitalio
+    import adafruit_rgb_display.st7789 as st7789
+    reset_pin = digitalio.DigitalInOut(board.D27)
+    cs_pin = digitalio.DigitalInOut(board.CE0)
+    dc_pin = digitalio.DigitalInOut(board.D25)
+    baudrate = 24000000
+    spi = board.SPI()
+    return ST7789Display(st7789.ST7789(spi, height=240, y_offset=80, rotation=180, cs=cs_pin, dc=dc_pin,
+                                       rst=reset_pin, baudrate=baudrate))
+
+
+def create_paj7620u2():
+    from PAJ7620U2 import PAJ7620U2
+    return PAJ7620U2()
+
+
+def create_co2_sensor():
+    return SimulatedCO2Sensor() if SIMULATED else MHZ19Sensor()
+
+
+def create_temp_hum_sensor():
+    return SimulatedDHTSensor(seed=1) if SIMULATED else DHT22Sensor()
+
+
+def create_gesture_sensor():
+    return SimulatedGestureSensor(seed=2) if SIMULATED else create_paj7620u2()
+
+
+def create_gesture_interrupt():
+    # the INT pin of the gesture sensor is optional wiring, without GESTURE_INT_PIN (bcm numbering) it is polled
+    pin = os.getenv("GESTURE_INT_PIN")
+    if SIMULATED or not pin:
+        return None
+    return GPIOInterrupt(int(pin))
+
+
+def create_display():
+    return NullDisplay() if SIMULATED else create_st7789_display()
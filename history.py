@@ -0,0 +1,309 @@
+"""
+Long term measurement history, one directory per device and channel and one chunk per day (UTC):
+
+    <root>/<device>/<channel>/<YYYY-MM-DD>.ts   uint32 unix timestamps, ascending
+    <root>/<device>/<channel>/<YYYY-MM-DD>.val  float32 values, same order
+    <root>/<device>/<channel>/<YYYY-MM-DD>.idx  uint32 timestamp of every INDEX_STRIDE-th sample
+
+The columns are plain little endian arrays, so other tools (or numpy.memmap) can read them directly. Queries only
+touch the day chunks and, through the sparse index, the parts of a chunk that overlap the requested range.
+
+    python3 history.py export out_dir --start 2021-01-01 --format parquet
+"""
+import argparse
+import datetime
+import os
+import socket
+import time
+
+import numpy as np
+
+from storage import MeasurementLog, RECORD_SIZE
+
+INDEX_STRIDE = 1024
+DAY = 24 * 3600
+
+
+def day_of(timestamp):
+    return time.strftime("%Y-%m-%d", time.gmtime(int(timestamp)))
+
+
+def day_start(day):
+    return int(datetime.datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+class DayChunk:
+    def __init__(self, path):
+        # path without extension
+        self.path = path
+        self.day = os.path.basename(path)
+        self._files = None
+
+    def __len__(self):
+        if not os.path.isfile(self.path + ".ts"):
+            return 0
+        return min(os.path.getsize(self.path + ".ts"), os.path.getsize(self.path + ".val")) // 4
+
+    def _open(self):
+        # a crash between the two column writes leaves one column longer, cut both to the complete samples
+        count = len(self)
+        for extension in (".ts", ".val"):
+            if os.path.isfile(self.path + extension) and os.path.getsize(self.path + extension) != count * 4:
+                with open(self.path + extension, "r+b") as f:
+                    f.truncate(count * 4)
+        index_count = -(-count // INDEX_STRIDE)
+        if not os.path.isfile(self.path + ".idx") or os.path.getsize(self.path + ".idx") != index_count * 4:
+            timestamps = np.fromfile(self.path + ".ts", dtype="<u4") if count else np.zeros(0, dtype="<u4")
+            timestamps[::INDEX_STRIDE].tofile(self.path + ".idx")
+        self._files = [open(self.path + extension, "ab") for extension in (".ts", ".val", ".idx")]
+        self.count = count
+
+    def append(self, timestamps, values):
+        if self._files is None:
+            self._open()
+        timestamps = np.asarray(timestamps, dtype="<u4")
+        ts_file, val_file, idx_file = self._files
+        # new index entries for the samples that start a stride
+        positions = self.count + np.arange(len(timestamps))
+        idx_file.write(timestamps[positions % INDEX_STRIDE == 0].tobytes())
+        ts_file.write(timestamps.tobytes())
+        val_file.write(np.asarray(values, dtype="<f4").tobytes())
+        for f in self._files:
+            f.flush()
+        self.count += len(timestamps)
+
+    def close(self):
+        if self._files is not None:
+            for f in self._files:
+                f.close()
+            self._files = None
+
+    def columns(self):
+        """(timestamps, values) memory mapped, nothing is read before it is used."""
+        count = len(self)
+        if count == 0:
+            return np.zeros(0, dtype="<u4"), np.zeros(0, dtype="<f4")
+        return (np.memmap(self.path + ".ts", dtype="<u4", mode="r", shape=(count,)),
+                np.memmap(self.path + ".val", dtype="<f4", mode="r", shape=(count,)))
+
+    def range(self, start, end):
+        """(timestamps, values) with start <= timestamp < end, as views of the memory mapped columns."""
+        timestamps, values = self.columns()
+        count = len(timestamps)
+        if count == 0:
+            return timestamps, values
+        index = np.fromfile(self.path + ".idx", dtype="<u4")[:-(-count // INDEX_STRIDE)]
+        # the index narrows the search to the strides containing start and end, only those pages are read
+        low = max(int(np.searchsorted(index, start, side="left")) - 1, 0) * INDEX_STRIDE
+        high = min(int(np.searchsorted(index, end, side="left")) * INDEX_STRIDE, count)
+        low += int(np.searchsorted(timestamps[low:high], start, side="left"))
+        high = low + int(np.searchsorted(timestamps[low:high], end, side="left"))
+        return timestamps[low:high], values[low:high]
+
+
+def _buckets(timestamps, values, resolution):
+    # (starts, sums, counts, mins, maxs) per bucket of `resolution` seconds, timestamps are ascending
+    starts = timestamps.astype(np.int64) - timestamps.astype(np.int64) % resolution
+    edges = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    values = values.astype(np.float64)
+    return (starts[edges], np.add.reduceat(values, edges), np.diff(np.r_[edges, len(values)]),
+            np.minimum.reduceat(values, edges), np.maximum.reduceat(values, edges))
+
+
+class HistoryStore:
+    """
+    Day chunked columnar history of all channels of one device (`device`, default DEPLOYMENT_ID or the host name).
+    append() is called by the channel's SensorTask only, queries may run from any thread or process.
+    """
+
+    def __init__(self, root="history", device=None):
+        self.root = root
+        self.device = device if device is not None else os.getenv("DEPLOYMENT_ID") or socket.gethostname()
+        self._chunks = {}
+        self._last_timestamps = {}
+
+    def _channel_dir(self, channel):
+        return os.path.join(self.root, self.device, channel)
+
+    def channels(self):
+        directory = os.path.join(self.root, self.device)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def days(self, channel):
+        directory = self._channel_dir(channel)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(directory) if name.endswith(".ts"))
+
+    def is_empty(self, channel):
+        return not self.days(channel)
+
+    def append(self, channel, value, timestamp):
+        # missing values are not stored, gaps in the timestamps show them
+        if value is None or np.isnan(value):
+            return
+        self.extend(channel, [timestamp], [value])
+
+    def extend(self, channel, timestamps, values):
+        """
+        Appends samples in ascending time order, split into their day chunks. Samples not newer than the last
+        stored one are skipped, so importing the same log twice does not duplicate anything.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64).astype(np.uint32)
+        values = np.asarray(values, dtype=np.float32)
+        keep = ~np.isnan(values) & (timestamps > self._last_timestamp(channel))
+        timestamps, values = timestamps[keep], values[keep]
+        if len(timestamps) == 0:
+            return
+        self._last_timestamps[channel] = int(timestamps[-1])
+        days = (timestamps // DAY).astype(np.int64)
+        edges = np.r_[np.flatnonzero(np.r_[True, days[1:] != days[:-1]]), len(days)]
+        for first, last in zip(edges[:-1], edges[1:]):
+            chunk = self._writer(channel, day_of(timestamps[first]))
+            chunk.append(timestamps[first:last], values[first:last])
+
+    def _last_timestamp(self, channel):
+        if channel not in self._last_timestamps:
+            days = self.days(channel)
+            timestamps = DayChunk(os.path.join(self._channel_dir(channel), days[-1])).columns()[0] if days else []
+            self._last_timestamps[channel] = int(timestamps[-1]) if len(timestamps) else -1
+        return self._last_timestamps[channel]
+
+    def _writer(self, channel, day):
+        chunk = self._chunks.get(channel)
+        if chunk is None or chunk.day != day:
+            if chunk is not None:
+                chunk.close()
+            os.makedirs(self._channel_dir(channel), exist_ok=True)
+            chunk = self._chunks[channel] = DayChunk(os.path.join(self._channel_dir(channel), day))
+        return chunk
+
+    def import_log(self, channel, path):
+        """Imports the records of a MeasurementLog file (see storage.py), returns the number of samples."""
+        if not os.path.isfile(path):
+            return 0
+        log = MeasurementLog(path, keep=os.path.getsize(path) // RECORD_SIZE)
+        records = log.read()
+        log.close()
+        return self.import_records(channel, records)
+
+    def import_records(self, channel, records):
+        """Imports (timestamp, value) records, returns their number."""
+        if records:
+            timestamps, values = zip(*sorted(records))
+            self.extend(channel, timestamps, values)
+        return len(records)
+
+    def _ranges(self, channel, start, end):
+        # (timestamps, values) per day chunk overlapping [start, end)
+        for day in self.days(channel):
+            first = day_start(day)
+            if first + DAY <= start or first >= end:
+                continue
+            yield DayChunk(os.path.join(self._channel_dir(channel), day)).range(start, end)
+
+    def query(self, channel, start=None, end=None, resolution=None):
+        """
+        Samples of `channel` with start <= timestamp < end (unix seconds, None for unbounded).
+        Returns (timestamps, values) without resolution, otherwise (timestamps, means, mins, maxs) per bucket of
+        `resolution` seconds. Only one day of raw samples is in memory at a time.
+        """
+        start = 0 if start is None else int(start)
+        end = 2 ** 32 if end is None else int(end)
+        if resolution is None:
+            parts = list(self._ranges(channel, start, end))
+            if not parts:
+                return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32)
+            return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+        parts = [_buckets(timestamps, values, resolution)
+                 for timestamps, values in self._ranges(channel, start, end) if len(timestamps)]
+        if not parts:
+            empty = np.zeros(0, dtype=np.float64)
+            return np.zeros(0, dtype=np.int64), empty, empty, empty
+        starts, sums, counts, mins, maxs = (np.concatenate(column) for column in zip(*parts))
+        # a bucket can span two day chunks, merge runs of equal bucket start
+        edges = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        counts = np.add.reduceat(counts, edges)
+        return (starts[edges], np.add.reduceat(sums, edges) / counts, np.minimum.reduceat(mins, edges),
+                np.maximum.reduceat(maxs, edges))
+
+    def export(self, directory, channels=None, start=None, end=None, format="npy"):
+        """
+        Writes one file per channel to `directory`: a structured .npy (timestamp, value) or, with pyarrow
+        installed, a .parquet file with one row group per day. Returns the written paths.
+        """
+        os.makedirs(directory, exist_ok=True)
+        start = 0 if start is None else int(start)
+        end = 2 ** 32 if end is None else int(end)
+        paths = []
+        for channel in channels if channels is not None else self.channels():
+            if format == "parquet":
+                paths.append(self._export_parquet(os.path.join(directory, f"{channel}.parquet"), channel, start, end))
+            else:
+                paths.append(self._export_npy(os.path.join(directory, f"{channel}.npy"), channel, start, end))
+        return paths
+
+    def _export_npy(self, path, channel, start, end):
+        ranges = list(self._ranges(channel, start, end))
+        dtype = np.dtype([("timestamp", "<u4"), ("value", "<f4")])
+        # the file is filled day by day through a memory map, so the export never holds more than one day
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(sum(len(t) for t, _ in ranges),))
+        position = 0
+        for timestamps, values in ranges:
+            out["timestamp"][position:position + len(timestamps)] = timestamps
+            out["value"][position:position + len(values)] = values
+            position += len(timestamps)
+        out.flush()
+        del out
+        return path
+
+    def _export_parquet(self, path, channel, start, end):
+        # optional dependency, only needed for this format
+        import pyarrow
+        import pyarrow.parquet
+
+        schema = pyarrow.schema([("timestamp", pyarrow.uint32()), ("value", pyarrow.float32())])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for timestamps, values in self._ranges(channel, start, end):
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(np.asarray(timestamps)), pyarrow.array(np.asarray(values))], schema=schema))
+        return path
+
+    def close(self):
+        for chunk in self._chunks.values():
+            chunk.close()
+        self._chunks = {}
+
+
+def _parse_day(text):
+    return None if text is None else day_start(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or import the measurement history")
+    parser.add_argument("--root", default="history")
+    parser.add_argument("--device", help="default: DEPLOYMENT_ID or the host name")
+    commands = parser.add_subparsers(dest="command")
+    export_parser = commands.add_parser("export", help="write one file per channel")
+    export_parser.add_argument("directory")
+    export_parser.add_argument("--channel", action="append", dest="channels")
+    export_parser.add_argument("--start", help="first day, YYYY-MM-DD")
+    export_parser.add_argument("--end", help="day after the last one, YYYY-MM-DD")
+    export_parser.add_argument("--format", choices=["npy", "parquet"], default="npy")
+    import_parser = commands.add_parser("import", help="import measurement_log_<channel>.bin files")
+    import_parser.add_argument("logs", nargs="+")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.root, args.device)
+    if args.command == "export":
+        for path in store.export(args.directory, args.channels, _parse_day(args.start), _parse_day(args.end),
+                                 args.format):
+            print(path)
+    elif args.command == "import":
+        for path in args.logs:
+            channel = os.path.basename(path)[len("measurement_log_"):-len(".bin")]
+            print(f"{path}: {store.import_log(channel, path)} samples imported into {channel}")
+        store.close()
+    else:
+        parser.print_help()
@@ -1,28 +1,83 @@
-from screens import Screen, Page_CO2Main, BlackPage, Page_HumMain, Page_TempMain
-from tasks import CO2ReaderTask, TemperatureReaderTask, HumidityReaderTask, TemperatureHumiditySensor, PlotBuilderTask, \
-    PingReaderTask, GestureReaderTask
+import os
+
+from animation import AnimationPlayer, BurnInProtection, default_screensaver
+from channels import CO2, TEMPERATURE, HUMIDITY
+from history import HistoryStore
+from metrics import start_metrics_server
+from processes import AcquisitionProcess
+from scheduler import AsyncScheduler
+from screens import Screen, BlackPage, ChannelPage
+from tasks import PlotBuilderTask, PingReaderTask, GestureReaderTask, create_sensor_sources
+
+def create_plot_tasks(tasks, channels, screen):
+    for channel in channels:
+        tasks["plot_" + channel.name] = PlotBuilderTask(retention=0, reader_task=tasks[channel.name], screen=screen)
+    for name in ["ping"] + [channel.name for channel in channels] + ["plot_" + channel.name for channel in channels]:
+        screen.watch(tasks[name])
+
 
 if __name__ == '__main__':
+    acquisition = None
+    if os.getenv("MULTI_PROCESS") == "1":
+        # sensors, ping and gestures in their own process, started before the display is opened
+        acquisition = AcquisitionProcess()
+        acquisition.start()
     screen = Screen()
 
-    temp_hum_sensor = TemperatureHumiditySensor()
-    tasks = {
-        "co2": CO2ReaderTask(deque_max_length=2500, sleep_time=8),
-        "temperature": TemperatureReaderTask(deque_max_length=2500, temp_hum_sensor=temp_hum_sensor, sleep_time=5),
-        "humidity": HumidityReaderTask(deque_max_length=2500, temp_hum_sensor=temp_hum_sensor, sleep_time=5),
-        "ping": PingReaderTask(deque_max_length=0),
-        "gesture": GestureReaderTask(deque_max_length=0, screen=screen)
-    }
-    tasks["plot_co2"] = PlotBuilderTask(deque_max_length=0, reader_task=tasks["co2"], screen=screen)
-    tasks["plot_temp"] = PlotBuilderTask(deque_max_length=0, reader_task=tasks["temperature"], screen=screen)
-    tasks["plot_hum"] = PlotBuilderTask(deque_max_length=0, reader_task=tasks["humidity"], screen=screen)
+    if acquisition is not None:
+        tasks, channels = acquisition.attach(screen)
+        create_plot_tasks(tasks, channels, screen)
+        readers = []
+    else:
+        sources = create_sensor_sources(history=HistoryStore())
+        tasks = {
+            "ping": PingReaderTask(retention=0),
+            "gesture": GestureReaderTask(retention=0, screen=screen)
+        }
+        channels = []
+        for source in sources:
+            channels += source.channels
+            tasks.update(source.tasks)
+        create_plot_tasks(tasks, channels, screen)
+        # the channel tasks have no loop of their own, they store what their source reads
+        readers = sources + [tasks["ping"], tasks["gesture"]]
 
-    page_black = BlackPage(screen=screen, tasks=tasks)
-    page_co2_main = Page_CO2Main(screen=screen, tasks=tasks)
-    page_temp_main = Page_TempMain(screen=screen, tasks=tasks)
-    page_hum_main = Page_HumMain(screen=screen, tasks=tasks)
+    if os.getenv("METRICS_PORT"):
+        # local only: curl localhost:$METRICS_PORT/metrics or /profile?seconds=10
+        start_metrics_server(int(os.getenv("METRICS_PORT")))
+
+    if os.getenv("ASYNC_RUNTIME") == "1":
+        # all readers and plot builders on one event loop, blocking driver calls in a small thread pool
+        scheduler = AsyncScheduler()
+        for task in readers:
+            if task is tasks["gesture"] and task.interrupt is not None:
+                # interrupt driven, its own thread only wakes up for gestures
+                task.start()
+                continue
+            # ping blocks for its timeout while the host is down and gestures must not wait behind slow reads
+            scheduler.add_periodic(task, pool={"ping": "network", "gesture": "gesture"}.get(task.name, "driver"))
+        for channel in channels:
+            scheduler.add_triggered(tasks["plot_" + channel.name], source=tasks[channel.name])
+        scheduler.start()
+    else:
+        # one thread per reader, plot builder threads are started by their pages
+        for task in readers:
+            task.start()
 
-    screen.add_pages([page_co2_main, page_temp_main, page_hum_main])
+    page_black = BlackPage(screen=screen, tasks=tasks)
+    screen.add_pages([
+        ChannelPage(screen=screen, tasks=tasks, channel=CO2, footer_channels=[TEMPERATURE, HUMIDITY]),
+        ChannelPage(screen=screen, tasks=tasks, channel=TEMPERATURE, footer_channels=[CO2, HUMIDITY]),
+        ChannelPage(screen=screen, tasks=tasks, channel=HUMIDITY, footer_channels=[CO2, TEMPERATURE]),
+    ])
     screen.add_blackpage(page_black)
+    if os.getenv("BURN_IN_INTERVAL"):
+        # plays the screensaver animation every BURN_IN_INTERVAL seconds, a gesture ends it right away
+        screen.set_burn_in_protection(BurnInProtection(AnimationPlayer(screen, default_screensaver()),
+                                                       interval=float(os.getenv("BURN_IN_INTERVAL"))))
 
-    screen.main_loop()
+    try:
+        screen.main_loop()
+    finally:
+        if acquisition is not None:
+            acquisition.stop()
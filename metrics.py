@@ -0,0 +1,194 @@
+import collections
+import math
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# sub buckets per power of two, 16 gives a relative error below ~3% for quantiles
+HISTOGRAM_SUB_BUCKETS = 16
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    def __init__(self, function=None):
+        # a gauge is either set explicitly or reads its value from `function` at scrape time
+        self.function = function
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram: constant memory, recording is one frexp and a list increment.
+    Values are expected in seconds, everything below 1 us ends up in the first bucket.
+    """
+
+    def __init__(self, quantiles=(0.5, 0.9, 0.99)):
+        self.quantiles = quantiles
+        self.counts = collections.defaultdict(int)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(value):
+        mantissa, exponent = math.frexp(max(value, 1e-6) * 1e6)
+        return exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa - 0.5) * 2 * HISTOGRAM_SUB_BUCKETS)
+
+    @staticmethod
+    def _upper_bound(index):
+        exponent, sub_bucket = divmod(index, HISTOGRAM_SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub_bucket + 1) / (2 * HISTOGRAM_SUB_BUCKETS), exponent) / 1e6
+
+    def observe(self, value):
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def time(self):
+        return Timer(self)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def samples(self, name, labels):
+        for q in self.quantiles:
+            yield name, dict(labels, quantile=str(q)), self.quantile(q)
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "summary"}
+
+    def __init__(self):
+        self.metrics = collections.OrderedDict()  # name -> (type, help, {labels: metric})
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = tuple(sorted((labels or {}).items()))
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = (cls, help_text, collections.OrderedDict())
+            children = self.metrics[name][2]
+            if key not in children:
+                children[key] = cls(**kwargs)
+            return children[key]
+
+    def counter(self, name, help_text="", labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", labels=None, function=None):
+        return self._get(Gauge, name, help_text, labels, function=function)
+
+    def histogram(self, name, help_text="", labels=None):
+        return self._get(Histogram, name, help_text, labels)
+
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            metrics = [(name, cls, help_text, list(children.items()))
+                       for name, (cls, help_text, children) in self.metrics.items()]
+        for name, cls, help_text, children in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {self.TYPES[cls]}")
+            for key, metric in children:
+                for sample_name, labels, value in metric.samples(name, dict(key)):
+                    label_text = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+                    lines.append(f"{sample_name}{{{label_text}}} {float(value)}" if label_text
+                                 else f"{sample_name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Sampling profiler over all threads: returns the stacks in the collapsed "frame;frame;frame count" format,
+    which flamegraph.pl and speedscope read directly.
+    """
+    own_thread = threading.get_ident()
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = collections.Counter()
+    end = time.time() + seconds
+    while time.time() < end:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = [f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                      for entry in traceback.extract_stack(frame)]
+            stacks[";".join([thread_names.get(thread_id, str(thread_id))] + frames)] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            body = registry.prometheus_text()
+        elif url.path == "/profile":
+            seconds = float(parse_qs(url.query).get("seconds", ["5"])[0])
+            body = sample_stacks(min(seconds, 60))
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serves /metrics (Prometheus text format) and /profile?seconds=N (collapsed stacks) in a daemon thread."""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+class SparklineRenderer:
+    """
+    Rasterizes a (mean, min, max) series straight into a PIL image.
+
+    Replaces the matplotlib figure + PNG encode/decode round trip; the min/max band is filled with one numpy mask,
+    the mean is a single polyline and the axis labels are drawn with the fonts the screen already loaded.
+    """
+
+    def __init__(self, font, width=220, height=120, label_width=40, line_color=(255, 255, 255),
+                 band_color=(90, 90, 90), axis_color=(128, 128, 128), label_color=(255, 255, 255),
+                 second_color=(255, 150, 40)):
+        self.font = font
+        self.width = width
+        self.height = height
+        self.label_width = label_width
+        self.line_color = line_color
+        self.band_color = np.array(band_color, dtype=np.uint8)
+        self.axis_color = axis_color
+        self.label_color = label_color
+        self.second_color = second_color
+        # plot area, leaving a few pixels at top and bottom so the line is not cut
+        self.x0, self.x1 = label_width, width - 1
+        self.y0, self.y1 = 4, height - 5
+        self._rows = np.arange(height)[:, None]
+
+    def _scale(self, values, low, high):
+        if high - low < 1e-6:
+            return np.full(len(values), (self.y0 + self.y1) // 2, dtype=np.int64)
+        relative = (np.asarray(values, dtype=np.float64) - low) / (high - low)
+        return np.round(self.y1 - relative * (self.y1 - self.y0)).astype(np.int64)
+
+    @staticmethod
+    def format_label(value):
+        if abs(value) >= 100:
+            return str(int(round(value)))
+        return str(round(float(value), 1))
+
+    def _polyline(self, draw, xs, ys, valid, color):
+        # one polyline per run of valid points
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], valid, [False])).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            if end - start > 1:
+                draw.line(list(zip(xs[start:end].tolist(), ys[start:end].tolist())), fill=color)
+            else:
+                draw.point((int(xs[start]), int(ys[start])), fill=color)
+
+    def _draw_second(self, draw, xs, second):
+        # second axis: own scale around zero, its largest magnitude is labelled top right
+        second = np.asarray(second, dtype=np.float64)
+        valid = np.isfinite(second)
+        if not valid.any():
+            return
+        extent = float(np.max(np.abs(second[valid])))
+        ys = np.zeros(len(second), dtype=np.int64)
+        ys[valid] = self._scale(second[valid], -extent, extent)
+        self._polyline(draw, xs, ys, valid, self.second_color)
+        draw.text((self.width - 40, 0), "±" + self.format_label(extent), self.second_color, font=self.font)
+
+    def render(self, means, mins, maxs, second=None):
+        """`second` is an optional series (same length as means) drawn on its own axis, e.g. a rate of change."""
+        pixels = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        n = len(means)
+        means, mins, maxs = (np.asarray(series, dtype=np.float64) for series in (means, mins, maxs))
+        # missing measurements are nan, they leave a gap in band and line
+        valid = np.isfinite(means) & np.isfinite(mins) & np.isfinite(maxs)
+        has_data = bool(valid.any())
+        if has_data:
+            low, high = float(np.min(mins[valid])), float(np.max(maxs[valid]))
+            xs = np.round(np.linspace(self.x0, self.x1, n)).astype(np.int64) if n > 1 \
+                else np.array([self.x1], dtype=np.int64)
+            # min/max band: one boolean mask over (rows, used columns), rows grow downwards
+            band_xs = xs[valid]
+            band = (self._rows >= self._scale(maxs[valid], low, high)[None, :]) & \
+                   (self._rows <= self._scale(mins[valid], low, high)[None, :])
+            band_pixels = pixels[:, band_xs]
+            band_pixels[band] = self.band_color
+            pixels[:, band_xs] = band_pixels
+        image = Image.fromarray(pixels, "RGB")
+        draw = ImageDraw.Draw(image)
+        draw.line(((self.x0 - 1, self.y0), (self.x0 - 1, self.y1)), fill=self.axis_color)
+        draw.line(((self.x0 - 1, self.y1), (self.x1, self.y1)), fill=self.axis_color)
+        if has_data:
+            if second is not None and len(second) == n:
+                self._draw_second(draw, xs, second)
+            ys = np.zeros(n, dtype=np.int64)
+            ys[valid] = self._scale(means[valid], low, high)
+            self._polyline(draw, xs, ys, valid, self.line_color)
+            draw.text((0, 0), self.format_label(high), self.label_color, font=self.font)
+            draw.text((0, self.height - 20), self.format_label(low), self.label_color, font=self.font)
+        return image
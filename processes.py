@@ -0,0 +1,300 @@
+import ctypes
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from history import HistoryStore
+from storage import AggregatePyramid, RingBuffer
+from tasks import SNAPSHOT_RESERVE, PingReaderTask, GestureReaderTask, Task, create_sensor_sources
+
+PR_SET_PDEATHSIG = 1
+
+# latest state of a channel in front of its series: version (odd while written), sequence, value, timestamp,
+# trend, slope, spike, number of samples appended to the series so far, minimum, maximum. nan stands for None.
+STATE_FIELDS = ("version", "sequence", "value", "timestamp", "trend", "slope", "spike", "appended", "minimum",
+                "maximum")
+STATE_SIZE = len(STATE_FIELDS) * 8
+
+
+def _nan_to_none(value):
+    return None if math.isnan(value) else value
+
+
+class SharedChannel:
+    """
+    State and stored series of one channel in a multiprocessing.shared_memory block: the acquisition process
+    writes, the render process reads without copying the series (RingBuffer on top of the block).
+    """
+
+    def __init__(self, channel, capacity, name=None):
+        self.channel = channel
+        self.capacity = capacity
+        create = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=create, size=STATE_SIZE + RingBuffer.size(capacity))
+        if not create:
+            # only the creating process may unlink the block, the tracker of an attaching process would do it at exit
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.state = np.ndarray((len(STATE_FIELDS),), dtype=np.float64, buffer=self.memory.buf)
+        self.ring = RingBuffer(self.memory.name, capacity, retention=channel.retention,
+                               buffer=self.memory.buf[STATE_SIZE:])
+
+    def describe(self):
+        # everything the other process needs to attach, sent over the control pipe
+        return self.channel, self.capacity, self.memory.name
+
+    def write(self, snapshot, stored):
+        # stored: snapshot.value was also appended to the series (the channel is past its warmup)
+        state = self.state
+        state[0] += 1
+        if stored:
+            self.ring.append(np.nan if snapshot.value is None else snapshot.value, snapshot.timestamp)
+            state[7] += 1
+        state[1:7] = [snapshot.sequence, *(np.nan if field is None else field for field in
+                                           (snapshot.value, snapshot.timestamp, snapshot.trend, snapshot.slope)),
+                      snapshot.spike]
+        state[8:10] = [np.nan if field is None else field for field in (snapshot.minimum, snapshot.maximum)]
+        state[0] += 1
+
+    def read_state(self, attempts=5):
+        """Seqlock read of the state fields, returns a dict."""
+        state = self.state.copy()
+        for _ in range(attempts):
+            version = self.state[0]
+            if version % 2 == 0:
+                state = self.state.copy()
+                if self.state[0] == version:
+                    break
+        return dict(zip(STATE_FIELDS, state.tolist()))
+
+    def unlink(self):
+        # views of the block may still be in use, so it is not closed, the mapping goes away with the process
+        self.memory.unlink()
+
+
+class Control:
+    """One end of the control pipe, send() may be called from several threads."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def send(self, *message):
+        with self.lock:
+            self.connection.send(message)
+
+
+class ScreenProxy:
+    """Stands in for the Screen in the acquisition process, the gesture task's page changes go over the pipe."""
+
+    def __init__(self, control):
+        self.control = control
+
+    def previous_page(self):
+        self.control.send("previous_page")
+
+    def next_page(self):
+        self.control.send("next_page")
+
+    def enable(self):
+        self.control.send("enable")
+
+    def disable(self):
+        self.control.send("disable")
+
+
+def _exit_with_parent(parent_pid):
+    # the kernel sends SIGTERM once the render process is gone, however it ended (crash, OOM kill, SIGKILL)
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
+    except (AttributeError, OSError):
+        pass
+    if os.getppid() != parent_pid:
+        raise SystemExit(0)
+
+
+def _terminate(signum, frame):
+    # unwinds into the finally of run_acquisition, which stops the tasks and unlinks the shared memory
+    raise SystemExit(0)
+
+
+def run_acquisition(connection, parent_connection, parent_pid):
+    """
+    Entry point of the acquisition process: sensors, ping and gesture sensor with their own threads. Channel
+    snapshots go to shared memory, the render process gets a short ("update", channel name) message per measurement.
+    Ends on a "stop" message, SIGTERM or when the render process is gone, so no second instance keeps the devices.
+    """
+    # the inherited end of the render process, otherwise recv() would never see EOF when it dies
+    parent_connection.close()
+    signal.signal(signal.SIGTERM, _terminate)
+    readers = []
+    shared = []
+    try:
+        _exit_with_parent(parent_pid)
+        control = Control(connection)
+        sources = create_sensor_sources(history=HistoryStore())
+        ping = PingReaderTask(retention=0)
+        gesture = GestureReaderTask(retention=0, screen=ScreenProxy(control))
+        for source in sources:
+            for channel in source.channels:
+                task = source.tasks[channel.name]
+                storage = task.rolling_measurement_storage
+                block = SharedChannel(channel, storage.capacity)
+                shared.append(block)
+                block.ring.extend_arrays(storage.timestamps(), storage.values())
+                block.state[7] = len(block.ring)
+                block.write(task.snapshot, stored=False)
+                task.subscribe(_forward(task, block, control))
+        ping.subscribe(lambda task: control.send("value", task.name, task.snapshot.value))
+        control.send("channels", [block.describe() for block in shared])
+
+        readers = sources + [ping, gesture]
+        for task in readers:
+            task.start()
+        # until the render process asks to stop or is gone, the parent pid check covers systems without prctl
+        while os.getppid() == parent_pid:
+            if connection.poll(1) and connection.recv() == ("stop",):
+                break
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        for task in readers:
+            task.stop()
+        for block in shared:
+            block.unlink()
+
+
+def _forward(task, block, control):
+    # task.version moves on with every stored measurement, a new snapshot without a store is still in its warmup
+    stored_version = task.version
+
+    def forward(task):
+        nonlocal stored_version
+        block.write(task.snapshot, task.version != stored_version)
+        stored_version = task.version
+        control.send("update", task.name)
+    return forward
+
+
+class SharedChannelTask(Task):
+    """
+    Render process side of a channel: the series is a view of the shared memory block, the aggregates for the plot
+    are kept up to date locally. Published like a SensorTask, so pages and plot builders work unchanged.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.channel = shared.channel
+        super().__init__(0, shared.channel.name)
+        self.retention = shared.channel.retention
+        self.rolling_measurement_storage = shared.ring
+        self.aggregates = AggregatePyramid(self.retention)
+        self.appended = 0
+        self.sync()
+
+    def _series(self):
+        return self.shared.ring.views(SNAPSHOT_RESERVE)
+
+    def sync(self):
+        state = self.shared.read_state()
+        appended = int(state["appended"])
+        new = appended - self.appended
+        if new > 0:
+            timestamps, values = self.shared.ring.timestamps(), self.shared.ring.values()
+            self.version += 1
+            try:
+                if new >= len(values):
+                    self.aggregates.rebuild(timestamps, values)
+                else:
+                    for timestamp, value in zip(timestamps[-new:].tolist(), values[-new:].tolist()):
+                        self.aggregates.append(value, timestamp)
+            finally:
+                self.version += 1
+            self.appended = appended
+        self.most_recent_measurement = _nan_to_none(state["value"])
+        trend = _nan_to_none(state["trend"])
+        self.publish(self.most_recent_measurement, _nan_to_none(state["timestamp"]),
+                     trend=None if trend is None else int(trend), slope=_nan_to_none(state["slope"]),
+                     spike=bool(state["spike"]), minimum=_nan_to_none(state["minimum"]),
+                     maximum=_nan_to_none(state["maximum"]))
+
+
+class AcquisitionProcess:
+    """
+    Runs the sensors in a separate process (run_acquisition), so rendering and frame composition never hold up
+    sensor timing and both use their own core. Started before the Screen, so the child does not inherit the display.
+    """
+
+    def __init__(self):
+        self.connection, self.child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=run_acquisition,
+                                               args=(self.child_connection, self.connection, os.getpid()),
+                                               name="acquisition", daemon=True)
+        self.control = Control(self.connection)
+        self.screen = None
+        self.tasks = {}
+        self.thread = None
+
+    def start(self):
+        self.process.start()
+        # only the child keeps its end, so recv() here sees EOF when the child dies
+        self.child_connection.close()
+
+    def attach(self, screen):
+        """
+        Waits for the shared channels of the acquisition process and returns (tasks, channels), tasks holds one
+        task per channel and "ping". Messages are then handled by a thread of this process.
+        """
+        self.screen = screen
+        try:
+            kind, described = self.connection.recv()
+        except EOFError:
+            self.process.join(5)
+            raise RuntimeError(f"acquisition process ended during startup (exit code {self.process.exitcode}), "
+                               "see its traceback above") from None
+        channels = []
+        for channel, capacity, name in described:
+            self.tasks[channel.name] = SharedChannelTask(SharedChannel(channel, capacity, name=name))
+            channels.append(channel)
+        self.tasks["ping"] = Task(0, "ping")
+        self.tasks["ping"].snapshot = self.tasks["ping"].snapshot._replace(value=False)
+        for task in self.tasks.values():
+            task.driver = self
+        self.thread = threading.Thread(target=self.receive_loop, name="acquisition", daemon=True)
+        self.thread.start()
+        return dict(self.tasks), channels
+
+    def is_alive(self):
+        return self.process.is_alive() and self.thread is not None and self.thread.is_alive()
+
+    def is_paused(self):
+        # the acquisition process has no pause, its tasks are fed as long as it runs
+        return False
+
+    def receive_loop(self):
+        while True:
+            try:
+                message = self.connection.recv()
+            except EOFError:
+                print("acquisition process has ended")
+                return
+            kind = message[0]
+            if kind == "update":
+                self.tasks[message[1]].sync()
+            elif kind == "value":
+                self.tasks[message[1]].publish(message[2])
+            elif kind in ("previous_page", "next_page", "enable", "disable"):
+                getattr(self.screen, kind)()
+
+    def stop(self, timeout=10):
+        try:
+            self.control.send("stop")
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
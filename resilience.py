@@ -0,0 +1,116 @@
+import math
+import random
+import threading
+import time
+
+# stored instead of a value when a sensor could not be read
+MISSING = float("nan")
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+class SensorReadError(Exception):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing device: after `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected right away for `reset_timeout` seconds. Then a single trial call is let through (half open);
+    its success closes the circuit, a failure opens it again for twice as long (up to `max_reset_timeout`).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, max_reset_timeout=600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.initial_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.reset_timeout = self.initial_reset_timeout
+
+    def record_failure(self):
+        with self.lock:
+            if self.state == "half_open":
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self.opened_at = time.time()
+                print(f"{self.name}: still failing, circuit open for {self.reset_timeout}s")
+                return
+            self.consecutive_failures += 1
+            if self.opened_at is None and self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.time()
+                print(f"{self.name}: {self.consecutive_failures} failures in a row, circuit open for "
+                      f"{self.reset_timeout}s")
+
+    def trip(self):
+        """Opens the circuit right away, e.g. for a device that is known to be missing."""
+        with self.lock:
+            self.consecutive_failures = max(self.consecutive_failures, self.failure_threshold)
+            if self.opened_at is None:
+                self.opened_at = time.time()
+                print(f"{self.name}: unavailable, circuit open for {self.reset_timeout}s")
+
+
+class RetryPolicy:
+    """Up to `attempts` tries with exponential backoff (base_delay * multiplier^n, capped, +-jitter)."""
+
+    def __init__(self, attempts=3, base_delay=0.5, multiplier=2, max_delay=5, jitter=0.1):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        delay = min(self.base_delay * self.multiplier ** attempt, self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def call_with_retry(function, policy, breaker, sleep=time.sleep, exceptions=(OSError, SensorReadError)):
+    """
+    Calls `function` under `policy` and `breaker`. A result of None counts as failed read.
+    Raises CircuitOpenError without calling anything while the breaker is open,
+    SensorReadError if all attempts failed. `sleep` can be an interruptible wait like Event.wait.
+    """
+    if not breaker.allow():
+        raise CircuitOpenError(breaker.name)
+    # a half open circuit only gets a single trial call
+    attempts = 1 if breaker.state == "half_open" else policy.attempts
+    last_error = None
+    for attempt in range(attempts):
+        if attempt > 0:
+            sleep(policy.delay(attempt - 1))
+        try:
+            result = function()
+            if result is not None:
+                breaker.record_success()
+                return result
+            last_error = SensorReadError(f"{breaker.name}: no data")
+        except exceptions as e:
+            last_error = e
+    breaker.record_failure()
+    raise SensorReadError(f"{breaker.name}: {attempts} attempts failed, last error {last_error!r}")
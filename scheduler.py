@@ -0,0 +1,112 @@
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncScheduler:
+    """
+    Optional runtime that drives all readers from one asyncio event loop instead of one thread per task.
+
+    Periodic jobs run every `interval` seconds (with +-`jitter` relative spread, so sensors sharing a bus do not
+    fire in lockstep). Triggered jobs run whenever their source task publishes a new measurement.
+    The blocking calls themselves run in small bounded thread pools, one per `pool` name: sensor reads can block
+    for seconds (retry backoff, ping timeout), so gestures and plot renders get pools of their own and never wait
+    behind them. "driver" has `max_workers` threads, every other pool one.
+    """
+
+    def __init__(self, max_workers=3, jitter=0.1):
+        self.executors = {"driver": ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="driver")}
+        self.jitter = jitter
+        self.jobs = []
+        self.loop = None
+        self.thread = None
+        self._stopping = None
+
+    def executor(self, pool):
+        if pool not in self.executors:
+            self.executors[pool] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=pool)
+        return self.executors[pool]
+
+    def add_callable(self, name, function, interval, is_paused=None, pool="driver"):
+        self.jobs.append(("periodic", name, function, interval, is_paused, None, self.executor(pool)))
+
+    def add_periodic(self, task, interval=None, pool="driver"):
+        # without an explicit interval task.sleep_time is read before every wait, so tasks can adapt it
+        task.scheduled = True
+        task.driver = self
+        task.start()
+        self.add_callable(task.name, task._run_once, interval if interval is not None else lambda: task.sleep_time,
+                          task.is_paused, pool)
+
+    def add_triggered(self, task, source, pool="render"):
+        # task runs whenever source has a new measurement, task.sleep_time is only used as idle re-check interval
+        task.scheduled = True
+        task.driver = self
+        self.jobs.append(("triggered", task.name, task._run_once, task.sleep_time, task.is_paused, source,
+                          self.executor(pool)))
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self, timeout=5):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self.thread is not None:
+            self.thread.join(timeout)
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._stopping = asyncio.Event()
+        self.loop.run_until_complete(self._main())
+        self.loop.close()
+
+    async def _main(self):
+        coroutines = []
+        for kind, name, function, interval, is_paused, source, executor in self.jobs:
+            if kind == "periodic":
+                coroutines.append(self._periodic(function, interval, is_paused, executor))
+            else:
+                coroutines.append(self._triggered(function, interval, is_paused, source, executor))
+        jobs = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        await self._stopping.wait()
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    def _jittered(self, interval):
+        if callable(interval):
+            interval = interval()
+        return max(0.0, interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    async def _periodic(self, function, interval, is_paused, executor):
+        # spread the first runs instead of starting all sensors at the same moment
+        await asyncio.sleep(random.uniform(0, self._jittered(interval) * self.jitter))
+        while True:
+            if is_paused is None or not is_paused():
+                await self.loop.run_in_executor(executor, function)
+            await asyncio.sleep(self._jittered(interval))
+
+    async def _triggered(self, function, interval, is_paused, source, executor):
+        new_data = asyncio.Event()
+        source.subscribe(lambda _: self.loop.call_soon_threadsafe(new_data.set))
+        handled_sequence = None
+        while True:
+            # cleared before reading the sequence, so data arriving while function runs is not missed
+            new_data.clear()
+            sequence = source.sequence
+            if sequence != handled_sequence and not is_paused():
+                await self.loop.run_in_executor(executor, function)
+                handled_sequence = sequence
+            try:
+                # the timeout also picks up resume() of a paused task
+                await asyncio.wait_for(new_data.wait(), timeout=min(interval, 1))
+            except asyncio.TimeoutError:
+                pass
@@ -1,34 +1,164 @@
-import math
 import os
+import queue
+import threading
 import time
-from collections import deque
+from collections import deque, OrderedDict
 
-import digitalio
-import board
-import adafruit_rgb_display.st7789 as st7789
 from PIL import Image, ImageDraw, ImageFont
-from ping3 import ping
-import io
-import matplotlib.pyplot as plt
 import numpy as np
-from tasks import CO2ReaderTask
+
+from animation import AnimationPlayer, default_screensaver
+from hardware import create_display
+from metrics import registry
+
+
+FONT_PATH = "/usr/share/fonts/truetype/open-sans/OpenSans-Light.ttf"
+FULL_SCREEN_BOX = (0, 0, 240, 240)
+# page layout, (x0, y0, x1, y1) with exclusive end coordinates
+HEADER_BOX = (0, 0, 240, 40)
+VALUE_BOX = (0, 40, 240, 100)
+PLOT_BOX = (0, 100, 240, 220)
+FOOTER_BOX = (0, 220, 240, 240)
+
+
+def load_font(size):
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        # fonts-open-sans is not installed (e.g. off-device runs), fall back to pillow's default font
+        print(f"{FONT_PATH} not found, using the default font")
+        return ImageFont.load_default()
+
+
+def rgb_to_rgb565(pixels, out, scratch):
+    """
+    Converts RGB888 `pixels` (h, w, 3) into RGB565 `out` (h, w), vectorized and without allocations:
+    `scratch` is a pair of native uint16 arrays of shape (h, w), `out` may be big endian as the display expects.
+    """
+    value, channel = scratch
+    np.copyto(value, pixels[..., 0], casting="unsafe")
+    value &= 0xF8
+    value <<= 8
+    np.copyto(channel, pixels[..., 1], casting="unsafe")
+    channel &= 0xFC
+    channel <<= 3
+    value |= channel
+    np.copyto(channel, pixels[..., 2], casting="unsafe")
+    channel >>= 3
+    value |= channel
+    out[...] = value
+
+
+class FrameWriter:
+    """
+    Sends frames to the display on its own thread, so the next frame is composed while the previous one is still
+    going over spi: frame latency is max(compose, transfer) instead of their sum.
+    A frame is a list of ((x, y) display origin, rgb pixels already rotated to display orientation). Up to `depth`
+    frames wait for the writer, submit() blocks beyond that. The RGB565 conversion runs on the writer thread into
+    buffers allocated once, the display backend gets the bytes through write_block(x, y, width, height, data).
+    """
+
+    def __init__(self, disp, depth=1):
+        self.disp = disp
+        self.queue = queue.Queue(maxsize=depth)
+        pixel_count = disp.width * disp.height
+        # the spi driver needs a bytes-like object (it tests `if not buf`), the conversion writes through a view
+        self.buffer = bytearray(pixel_count * 2)
+        self.pixel_data = np.frombuffer(self.buffer, dtype=np.uint8)
+        self.scratch = (np.empty(pixel_count, dtype=np.uint16), np.empty(pixel_count, dtype=np.uint16))
+        self.transfer_time = registry.histogram("display_transfer_seconds", "Time to convert and send one frame")
+        self.thread = threading.Thread(target=self.run, name="display", daemon=True)
+        self.thread.start()
+
+    def submit(self, regions):
+        self.queue.put(regions)
+
+    def wait_idle(self):
+        # blocks until every submitted frame is on the display
+        self.queue.join()
+
+    def write(self, x, y, pixels):
+        height, width = pixels.shape[:2]
+        count = height * width
+        out = self.pixel_data[:count * 2].view(">u2").reshape(height, width)
+        rgb_to_rgb565(pixels, out, tuple(array[:count].reshape(height, width) for array in self.scratch))
+        self.disp.write_block(x, y, width, height, memoryview(self.buffer)[:count * 2])
+
+    def run(self):
+        while True:
+            regions = self.queue.get()
+            try:
+                with self.transfer_time.time():
+                    for (x, y), pixels in regions:
+                        self.write(x, y, pixels)
+            except Exception as e:
+                print(f"display: writing a frame failed with {e!r}")
+            finally:
+                self.queue.task_done()
+
+
+class TextCache:
+    """
+    LRU cache of rasterized strings: (text, font) -> alpha mask and offset. FreeType runs once per distinct string,
+    afterwards drawing is a single Image.paste of the color through the mask. The color is applied at paste time,
+    so one mask serves every color the string is shown in.
+    """
+
+    def __init__(self, max_entries=256, max_size=(240, 80)):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        # strings are rasterized on a scratch image of this size, nothing on the screen is larger
+        self.max_size = max_size
+        self.hits = registry.counter("text_cache_hits_total", "Strings drawn from the text cache")
+        self.misses = registry.counter("text_cache_misses_total", "Strings rasterized with FreeType")
+
+    def get(self, text, font):
+        key = (text, font)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits.inc()
+            return entry
+        self.misses.inc()
+        scratch = Image.new("L", self.max_size)
+        ImageDraw.Draw(scratch).text((0, 0), text, fill=255, font=font)
+        bbox = scratch.getbbox()
+        # (mask, (x offset, y offset)), an empty mask for blank strings
+        entry = (scratch.crop(bbox), bbox[:2]) if bbox is not None else (None, (0, 0))
+        self.entries[key] = entry
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
 
 
 class Screen:
-    def __init__(self):
-        self.reset_pin = digitalio.DigitalInOut(board.D27)
-        self.cs_pin = digitalio.DigitalInOut(board.CE0)
-        self.dc_pin = digitalio.DigitalInOut(board.D25)
-        self.BAUDRATE = 24000000
-        self.spi = board.SPI()
-        self.disp = st7789.ST7789(self.spi, height=240, y_offset=80, rotation=180, cs=self.cs_pin, dc=self.dc_pin,
-                                  rst=self.reset_pin, baudrate=self.BAUDRATE)
+    def __init__(self, target_fps=10, idle_fps=1, disp=None):
+        self.disp = disp if disp is not None else create_display()
         self.image = Image.new("RGB", (240, 240))
         self.draw = ImageDraw.Draw(self.image)
         # fonts_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fonts')
-        self.font_small = ImageFont.truetype("/usr/share/fonts/truetype/open-sans/OpenSans-Light.ttf", 14)
-        self.font_middle = ImageFont.truetype("/usr/share/fonts/truetype/open-sans/OpenSans-Light.ttf", 24)
-        self.font_big = ImageFont.truetype("/usr/share/fonts/truetype/open-sans/OpenSans-Light.ttf", 40)
+        self.font_small = load_font(14)
+        self.font_middle = load_font(24)
+        self.font_big = load_font(40)
+        self.text_cache = TextCache()
+        # static parts of pages, rendered once: key -> image of the region
+        self.layers = dict()
+
+        # damage tracking: content key per region and the regions that have to be sent to the display
+        self.region_keys = dict()
+        self.dirty_regions = list()
+        self.frames_sent = 0
+        self.governor = FrameGovernor(target_fps=target_fps, idle_fps=idle_fps)
+        # time the compose loop was blocked by the writer, the transfer itself overlaps with composing
+        self.frame_transfer_time = 0
+        self.compose_time = registry.histogram("frame_compose_seconds", "Time to compose a frame, without transfer")
+        self.writer_wait_time = registry.histogram("display_writer_wait_seconds",
+                                                   "Time a frame waited for the display writer to take it")
+        self.writer = FrameWriter(self.disp)
+
+        # animations running full screen (screensaver) and the optional burn-in protection schedule
+        self.players = list()
+        self.burn_in_protection = None
 
         self.pages = list()
         self.page_black = None
@@ -43,46 +173,225 @@ class Screen:
     def add_blackpage(self, page_black):
         self.page_black = page_black
 
+    def add_player(self, player):
+        # players are interrupted by every user interaction
+        self.players.append(player)
+
+    def set_burn_in_protection(self, burn_in_protection):
+        self.add_player(burn_in_protection.player)
+        self.burn_in_protection = burn_in_protection
+
+    def interrupt_animations(self):
+        for player in self.players:
+            player.interrupt()
+
     def disable(self):
         self.screen_enabled = False
 
     def enable(self):
         self.screen_enabled = True
+        self.interrupt_animations()
+        self.governor.boost()
 
     def previous_page(self):
         self.current_page -= 1
         self.current_page = max(0, self.current_page)
         self.page_change = True
+        self.interrupt_animations()
+        self.governor.boost()
 
     def next_page(self):
         self.current_page += 1
         self.current_page = min(len(self.pages) - 1, self.current_page)
         self.page_change = True
+        self.interrupt_animations()
+        self.governor.boost()
+
+    def watch(self, task):
+        # redraw as soon as the task has something new instead of waiting for the next idle frame
+        task.subscribe(self.governor.wake)
+
+    def update_region(self, box, key):
+        """
+        Returns True if the content `key` of the region `box` (x0, y0, x1, y1) changed since the last frame.
+        The region is then cleared and marked dirty, and the caller has to draw it again.
+        """
+        if self.region_keys.get(box) == key:
+            return False
+        self.region_keys[box] = key
+        self.draw.rectangle((box[0], box[1], box[2] - 1, box[3] - 1), fill="black")
+        self.dirty_regions.append(box)
+        return True
+
+    def text(self, xy, text, color, font):
+        """Draws text like ImageDraw.text, from the text cache."""
+        mask, (dx, dy) = self.text_cache.get(text, font)
+        if mask is None:
+            return
+        x, y = xy[0] + dx, xy[1] + dy
+        self.image.paste(color, (x, y, x + mask.size[0], y + mask.size[1]), mask)
+
+    def layer(self, key, box, render):
+        """
+        Pastes the static layer `key` into `box`. The first time, the layer is drawn by render(draw, origin)
+        on a black image of the box size, with origin the top left screen coordinate of the box.
+        """
+        image = self.layers.get(key)
+        if image is None:
+            image = Image.new("RGB", (box[2] - box[0], box[3] - box[1]))
+            render(ImageDraw.Draw(image), (box[0], box[1]))
+            self.layers[key] = image
+        self.image.paste(image, box[:2])
+
+    def invalidate(self):
+        # forget all region contents, e.g. after a page change, so the next frame is drawn and sent completely
+        self.region_keys.clear()
+        self.dirty_regions = [FULL_SCREEN_BOX]
+
+    def clear(self):
+        self.draw.rectangle(((0, 0), (240, 240)), fill="black")
+        self.invalidate()
+
+    def display_origin(self, box):
+        # the display rotates the image it gets, so the window position has to be rotated as well
+        x0, y0, x1, y1 = box
+        width, height = self.image.size
+        rotation = self.disp.rotation
+        if rotation == 90:
+            return y0, width - x1
+        elif rotation == 180:
+            return width - x1, height - y1
+        elif rotation == 270:
+            return height - y1, x0
+        return x0, y0
+
+    def display_pixels(self, box):
+        # the display shows the image rotated (counter clockwise, as Image.rotate), np.rot90 does the same as a view
+        pixels = np.asarray(self.image.crop(box))
+        return np.rot90(pixels, self.disp.rotation // 90)
+
+    def flush(self):
+        """
+        Hands the dirty regions (windowed writes) to the display writer, returns True if anything was sent.
+        Only blocks if the writer is still busy with the frame before the previous one.
+        """
+        if not self.dirty_regions:
+            return False
+        boxes = [FULL_SCREEN_BOX] if FULL_SCREEN_BOX in self.dirty_regions else self.dirty_regions
+        regions = [(self.display_origin(box), self.display_pixels(box)) for box in boxes]
+        wait_start = time.perf_counter()
+        self.writer.submit(regions)
+        wait_time = time.perf_counter() - wait_start
+        self.writer_wait_time.observe(wait_time)
+        self.frame_transfer_time += wait_time
+        self.dirty_regions = list()
+        self.frames_sent += 1
+        return True
+
+    def submit_frame(self, pixels):
+        """Sends a full frame given as uint8 array (height, width, 3), e.g. from an animation, to the display."""
+        self.writer.submit([(self.display_origin(FULL_SCREEN_BOX), np.rot90(pixels, self.disp.rotation // 90))])
+        self.frames_sent += 1
 
     def main_loop(self):
-        render_time_deque = deque(maxlen=50)
-        fps_loop_counter = 0
         while True:
             time_start = time.time()
-            self.image = Image.new("RGB", (240, 240))
-            self.draw = ImageDraw.Draw(self.image)
+            frames_sent = self.frames_sent
+            if self.screen_enabled and self.burn_in_protection is not None and self.burn_in_protection.due():
+                self.burn_in_protection.run()
             if self.screen_enabled:
+                self.governor.frame_started()
                 if self.page_change:
                     for elem in self.pages:
-                        elem.kill_plot_worker()
+                        elem.pause_plot_worker()
                     self.page_black.draw_frame()
                     self.page_change = False
+                self.frame_transfer_time = 0
                 self.pages[self.current_page].ensure_plot_worker()
                 self.pages[self.current_page].draw_frame()
-                render_time_deque.append(time.time() - time_start)
-                if fps_loop_counter == 50:
-                    fps_loop_counter = 0
-                    print(f"Avg. FPS: {1 / np.average(render_time_deque)}")
-                fps_loop_counter += 1
+                if self.frames_sent != frames_sent:
+                    self.compose_time.observe(time.time() - time_start - self.frame_transfer_time)
+                self.governor.frame_finished(time_start, sent=self.frames_sent != frames_sent)
             else:
                 self.page_black.draw_frame()
                 time.sleep(0.5)
 
+    def render_stats(self):
+        return self.governor.stats()
+
+
+class FrameGovernor:
+    """
+    Paces Screen.main_loop: frames are drawn at most at `target_fps`, at `boost_fps` for `boost_duration` seconds
+    after gestures or page changes, and only every 1 / `idle_fps` seconds while nothing on the screen changed.
+    A call to wake() (e.g. from a task that stored a new measurement) ends an idle wait early.
+    """
+
+    def __init__(self, target_fps=10, idle_fps=1, boost_fps=30, boost_duration=2):
+        self.target_fps = target_fps
+        self.idle_fps = idle_fps
+        self.boost_fps = boost_fps
+        self.boost_duration = boost_duration
+        self.boost_until = 0
+        self.wake_event = threading.Event()
+
+        self.render_times = deque(maxlen=200)
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.started = time.time()
+
+    def wake(self, *_):
+        # signature allows using it directly as Task.subscribe callback
+        self.wake_event.set()
+
+    def boost(self):
+        self.boost_until = time.time() + self.boost_duration
+        self.wake_event.set()
+
+    def frame_started(self):
+        # cleared before the frame is composed, a wake() during composition then ends the following wait right away
+        self.wake_event.clear()
+
+    def frame_finished(self, frame_start, sent):
+        now = time.time()
+        if sent:
+            self.frames_sent += 1
+            self.render_times.append(now - frame_start)
+        else:
+            self.frames_skipped += 1
+        if now < self.boost_until:
+            interval = 1 / self.boost_fps
+        elif sent:
+            interval = 1 / self.target_fps
+        else:
+            interval = 1 / self.idle_fps
+        remaining = frame_start + interval - now
+        if remaining > 0:
+            self.wake_event.wait(remaining)
+
+    def stats(self):
+        stats = {
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "fps": self.frames_sent / max(time.time() - self.started, 1e-6),
+        }
+        if self.render_times:
+            render_times = np.array(self.render_times)
+            stats["render_time_avg"] = float(np.mean(render_times))
+            stats["render_time_p50"] = float(np.percentile(render_times, 50))
+            stats["render_time_p95"] = float(np.percentile(render_times, 95))
+            stats["render_time_max"] = float(np.max(render_times))
+        return stats
+
+
+def format_measurement(value, digits=None):
+    # a task without a valid current value (not read yet or the last read failed) shows "--"
+    if value is None:
+        return "--"
+    if digits == 0:
+        return str(int(round(value)))
+    return str(value if digits is None else round(value, digits))
+
 
 class Page:
     def __init__(self, screen: Screen, tasks: dict):
@@ -90,6 +399,12 @@ class Page:
         self.tasks = tasks
         self.screensaver = False
 
+    def ensure_plot_worker(self):
+        pass
+
+    def pause_plot_worker(self):
+        pass
+
     def draw_frame(self):
         pass
 
@@ -99,260 +414,110 @@ class BlackPage(Page):
         super().__init__(screen, tasks)
 
     def draw_frame(self):
-        self.screen.draw.rectangle(((0, 0), (240, 240)), fill="black")
-        self.screen.disp.image(self.screen.image)
+        self.screen.clear()
+        self.screen.flush()
 
-class Page_CO2Main(Page):
-    def __init__(self, screen: Screen, tasks: dict):
+class ChannelPage(Page):
+    """
+    Main page of one channel: title and sample count, the current value, the plot of its history and the current
+    values of `footer_channels` at the bottom. Expects the channel task under `channel.name` and its plot builder
+    under "plot_" + `channel.name` in tasks.
+    """
+
+    def __init__(self, screen: Screen, tasks: dict, channel, footer_channels=()):
         super().__init__(screen, tasks)
-        self.sleep_time = 10
+        self.channel = channel
+        self.footer_channels = footer_channels
+        self.task = tasks[channel.name]
+        self.plot_task = tasks["plot_" + channel.name]
+        self.previous_measurement_id = 0
         self.plot_worker_running = False
-        self.previous_co2_measurement_id = 0
-        self.draw_time_list = deque(maxlen=2500)
-
-    def get_color_for_value(self, ppm_value):
-        if ppm_value < 1000:
-            return (95, 255, 66)
-        elif ppm_value < 1400:
-            return (255, 238, 56)
-        else:
-            return (255, 69, 56)
 
     def ensure_plot_worker(self):
         if not self.plot_worker_running:
-            self.tasks["plot_co2"].start_background_thread()
+            self.plot_task.start()
             self.plot_worker_running = True
-        else:
-            pass
-
-    def kill_plot_worker(self):
-        self.tasks["plot_co2"].stop_background_thread()
-        self.plot_worker_running = False
-
-    def draw_frame(self):
-        time_start = time.time()
-        self.screen.draw.text((0, 0), "ppm CO2", (255, 255, 255), font=self.screen.font_middle)
-        self.screen.draw.text((110, 10), f"sleep: {self.sleep_time}s", (255, 255, 255), font=self.screen.font_small)
-        self.screen.draw.text((180, 10), f"#: {len(self.tasks['co2'].rolling_measurement_storage)}", (255, 255, 255), font=self.screen.font_small)
-
-        if os.getenv("DEPLOYMENT_ID") == 410:
-            if self.tasks["ping"].most_recent_measurement:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="green")
-            else:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="red")
-
-        #temp hum
-        self.screen.draw.text((0, 220), f"t:{round(self.tasks['temperature'].most_recent_measurement, 1)}°C", (255, 255, 255), font=self.screen.font_small)
-        self.screen.draw.text((80, 220), f"h:{round(self.tasks['humidity'].most_recent_measurement, 1)}%", (255, 255, 255), font=self.screen.font_small)
-
-        #co2
-
-        if self.tasks['co2'].counter != self.previous_co2_measurement_id:
-            color = (252, 255, 150)
-        else:
-            color = (255, 255, 255)
-        self.screen.draw.text((0, 46), str(self.tasks['co2'].most_recent_measurement) + " ppm", color, font=self.screen.font_big)
-        self.previous_co2_measurement_id = self.tasks['co2'].counter
-
-        dtl = list(self.draw_time_list)
-        dtl.sort()
-        if len(dtl) >= 10:
-            median_measurement_interval = self.tasks['co2'].sleep_time + dtl[int(len(dtl) / 2)]
-        else:
-            median_measurement_interval = self.tasks['co2'].sleep_time + 0
-        # how many hours are covered by the graph (on median draw time and wait time)
-        coverage_hours = round(
-            (median_measurement_interval * len(self.tasks['co2'].rolling_measurement_storage)) / 3600, 2)
-        self.screen.draw.text((180, 220), f"~{coverage_hours}h", (255, 255, 255), font=self.screen.font_small)
-
-        self.screen.draw.rectangle(((0, 40), (240, 42)), fill=self.get_color_for_value(self.tasks['co2'].most_recent_measurement))
-
-        #plot
-        self.tasks["plot_co2"].semaphore.acquire()
-        if self.tasks["plot_co2"].im is not None:
-            self.screen.image.paste(self.tasks["plot_co2"].im, (10, 100))
-        self.tasks["plot_co2"].semaphore.release()
-        self.screen.disp.image(self.screen.image)
-        self.draw_time_list.append(time.time() - time_start)
-
-
-class Page_TempMain(Page):
-    def __init__(self, screen: Screen, tasks: dict):
-        super().__init__(screen, tasks)
-        self.sleep_time = 10
 
-        self.previous_temp_measurement_id = 0
+    def pause_plot_worker(self):
+        # pausing keeps the thread and the last plot, switching back to this page does not have to wait for a render
+        self.plot_task.pause()
         self.plot_worker_running = False
-        self.draw_time_list = deque(maxlen=2500)
 
-    def get_color_for_value(self, ppm_value):
-        if ppm_value < 1000:
-            return (95, 255, 66)
-        elif ppm_value < 1400:
-            return (255, 238, 56)
-        else:
-            return (255, 69, 56)
+    def draw_title(self, draw, origin):
+        draw.text((0, 0), self.channel.title, (255, 255, 255), font=self.screen.font_middle)
 
-    def ensure_plot_worker(self):
-        if not self.plot_worker_running:
-            self.tasks["plot_temp"].start_background_thread()
-            self.plot_worker_running = True
+    def draw_trend(self, trend, slope_text):
+        # arrow head up / down for rising / falling, a bar if flat, and the slope over the trend window below
+        x, y = 185, 46
+        if trend > 0:
+            shape = ((x, y + 16), (x + 20, y + 16), (x + 10, y))
+        elif trend < 0:
+            shape = ((x, y), (x + 20, y), (x + 10, y + 16))
         else:
-            pass
+            shape = ((x, y + 6), (x + 20, y + 6), (x + 20, y + 10), (x, y + 10))
+        self.screen.draw.polygon(shape, fill=(255, 255, 255))
+        self.screen.text((160, 64), slope_text, (255, 255, 255), self.screen.font_small)
 
-    def kill_plot_worker(self):
-        self.tasks["plot_temp"].stop_background_thread()
-        self.plot_worker_running = False
+    def footer_text(self, channel):
+        value = format_measurement(self.tasks[channel.name].snapshot.value, channel.digits)
+        return f"{channel.label}: {value}{channel.unit}"
 
     def draw_frame(self):
-        time_start = time.time()
-        self.screen.draw.text((0, 0), "°C temperature", (255, 255, 255), font=self.screen.font_middle)
-        #self.screen.draw.text((110, 10), f"sleep: {self.sleep_time}s", (255, 255, 255), font=self.screen.font_small)
-        #self.screen.draw.text((180, 10), f"#: {len(self.tasks['co2'].rolling_measurement_storage)}", (255, 255, 255),
-        #                      font=self.screen.font_small)
-
-        if os.getenv("DEPLOYMENT_ID") == 410:
-            if self.tasks["ping"].most_recent_measurement:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="green")
-            else:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="red")
+        # every task is read through one snapshot per frame, the reader threads swap them in without waiting for us
+        snapshot = self.task.snapshot
+        measurement = snapshot.value
+        stored = len(snapshot.values)
 
-        self.screen.draw.text((0, 220), f"co2: {round(self.tasks['co2'].most_recent_measurement, 1)} ppm",
-                              (255, 255, 255), font=self.screen.font_small)
-        self.screen.draw.text((100, 220), f"h: {round(self.tasks['humidity'].most_recent_measurement, 1)}%",
-                              (255, 255, 255), font=self.screen.font_small)
+        if self.screen.update_region(HEADER_BOX, stored):
+            self.screen.layer(("title", self.channel.name), HEADER_BOX, self.draw_title)
+            self.screen.text((180, 10), f"#: {stored}", (255, 255, 255), self.screen.font_small)
 
-        if self.tasks['temperature'].counter != self.previous_temp_measurement_id:
+        if snapshot.sequence != self.previous_measurement_id:
             color = (252, 255, 150)
         else:
             color = (255, 255, 255)
-        self.screen.draw.text((0, 46), str(self.tasks['temperature'].most_recent_measurement) + " °C", color,
-                              font=self.screen.font_big)
-        self.previous_temp_measurement_id = self.tasks['temperature'].counter
-
-        dtl = list(self.draw_time_list)
-        dtl.sort()
-        if len(dtl) >= 10:
-            median_measurement_interval = self.tasks['temperature'].sleep_time + dtl[int(len(dtl) / 2)]
-        else:
-            median_measurement_interval = self.tasks['temperature'].sleep_time + 0
-        # how many hours are covered by the graph (on median draw time and wait time)
-        coverage_hours = round(
-            (median_measurement_interval * len(self.tasks['temperature'].rolling_measurement_storage)) / 3600, 2)
-        self.screen.draw.text((180, 220), f"~{coverage_hours}h", (255, 255, 255), font=self.screen.font_small)
-
-        self.screen.draw.rectangle(((0, 40), (240, 42)),
-                                   fill=(95, 255, 66))
+        self.previous_measurement_id = snapshot.sequence
+        ping_ok = self.tasks["ping"].snapshot.value if os.getenv("DEPLOYMENT_ID") == 410 else None
+        trend, slope = snapshot.trend, snapshot.slope
+        slope_text = None if slope is None else f"{slope:+.{max(self.channel.digits, 1)}f}/min"
+        range_text = None if snapshot.minimum is None else \
+            f"{format_measurement(snapshot.minimum, self.channel.digits)}.." \
+            f"{format_measurement(snapshot.maximum, self.channel.digits)}"
+        if self.screen.update_region(VALUE_BOX, (measurement, color, ping_ok, trend, slope_text, range_text,
+                                                 snapshot.spike)):
+            self.screen.draw.rectangle(((0, 40), (240, 42)), fill=self.channel.color(measurement))
+            value_text = f"{format_measurement(measurement, self.channel.digits)} {self.channel.unit}"
+            # a value the signal stage flagged as spike is shown in orange
+            self.screen.text((0, 46), value_text, (255, 150, 40) if snapshot.spike else color, self.screen.font_big)
+            if trend is not None:
+                self.draw_trend(trend, slope_text)
+            if range_text is not None:
+                # lowest and highest value of the trend window
+                self.screen.text((160, 82), range_text, (180, 180, 180), self.screen.font_small)
+            if ping_ok is not None:
+                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="green" if ping_ok else "red")
 
         # plot
-        self.tasks["plot_temp"].semaphore.acquire()
-        if self.tasks["plot_temp"].im is not None:
-            self.screen.image.paste(self.tasks["plot_temp"].im, (10, 100))
-        self.tasks["plot_temp"].semaphore.release()
-        self.screen.disp.image(self.screen.image)
-        self.draw_time_list.append(time.time() - time_start)
+        plot = self.plot_task.snapshot
+        if self.screen.update_region(PLOT_BOX, plot.sequence) and plot.value is not None:
+            self.screen.image.paste(plot.value, (10, 100))
 
+        # how many hours are covered by the graph (first to last stored timestamp)
+        coverage_hours = round(snapshot.coverage() / 3600, 2)
+        footer = tuple(self.footer_text(channel) for channel in self.footer_channels)
+        if self.screen.update_region(FOOTER_BOX, (footer, coverage_hours)):
+            for i, text in enumerate(footer):
+                self.screen.text((90 * i, 220), text, (255, 255, 255), self.screen.font_small)
+            self.screen.text((180, 220), f"~{coverage_hours}h", (255, 255, 255), self.screen.font_small)
 
-class Page_HumMain(Page):
-    def __init__(self, screen: Screen, tasks: dict):
-        super().__init__(screen, tasks)
-        self.sleep_time = 10
-
-        self.previous_hum_measurement_id = 0
-        self.plot_worker_running = False
-        self.draw_time_list = deque(maxlen=2500)
-
-    def get_color_for_value(self, ppm_value):
-        if ppm_value < 1000:
-            return (95, 255, 66)
-        elif ppm_value < 1400:
-            return (255, 238, 56)
-        else:
-            return (255, 69, 56)
-
-    def ensure_plot_worker(self):
-        if not self.plot_worker_running:
-            self.tasks["plot_hum"].start_background_thread()
-            self.plot_worker_running = True
-        else:
-            pass
-
-    def kill_plot_worker(self):
-        self.tasks["plot_hum"].stop_background_thread()
-        self.plot_worker_running = False
-
-    def draw_frame(self):
-        time_start = time.time()
-        self.screen.draw.text((0, 0), "% humidity (relative)", (255, 255, 255), font=self.screen.font_middle)
-        #self.screen.draw.text((110, 10), f"sleep: {self.sleep_time}s", (255, 255, 255), font=self.screen.font_small)
-        #self.screen.draw.text((180, 10), f"#: {len(self.tasks['co2'].rolling_measurement_storage)}", (255, 255, 255),
-        #                      font=self.screen.font_small)
-
-        if os.getenv("DEPLOYMENT_ID") == 410:
-            if self.tasks["ping"].most_recent_measurement:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="green")
-            else:
-                self.screen.draw.rectangle(((205, 60), (230, 85)), fill="red")
-
-        self.screen.draw.text((0, 220), f"co2: {round(self.tasks['co2'].most_recent_measurement, 1)} ppm",
-                              (255, 255, 255), font=self.screen.font_small)
-        self.screen.draw.text((100, 220), f"t: {round(self.tasks['temperature'].most_recent_measurement, 1)} °C",
-                              (255, 255, 255), font=self.screen.font_small)
-
-        if self.tasks['humidity'].counter != self.previous_hum_measurement_id:
-            color = (252, 255, 150)
-        else:
-            color = (255, 255, 255)
-        self.screen.draw.text((0, 46), str(self.tasks['humidity'].most_recent_measurement) + " %", color,
-                              font=self.screen.font_big)
-        self.previous_hum_measurement_id = self.tasks['humidity'].counter
-
-        dtl = list(self.draw_time_list)
-        dtl.sort()
-        if len(dtl) >= 10:
-            median_measurement_interval = self.tasks['humidity'].sleep_time + dtl[int(len(dtl) / 2)]
-        else:
-            median_measurement_interval = self.tasks['humidity'].sleep_time + 0
-        # how many hours are covered by the graph (on median draw time and wait time)
-        coverage_hours = round((median_measurement_interval * len(self.tasks['humidity'].rolling_measurement_storage)) / 3600, 2)
-        self.screen.draw.text((180, 220), f"~{coverage_hours}h", (255, 255, 255), font=self.screen.font_small)
-
-        self.screen.draw.rectangle(((0, 40), (240, 42)),
-                                   fill=(95, 255, 66))
-
-        # plot
-        self.tasks["plot_hum"].semaphore.acquire()
-        if self.tasks["plot_hum"].im is not None:
-            self.screen.image.paste(self.tasks["plot_hum"].im, (10, 100))
-        self.tasks["plot_hum"].semaphore.release()
-        self.screen.disp.image(self.screen.image)
-        self.draw_time_list.append(time.time() - time_start)
+        self.screen.flush()
 
 
 class Page_Screensaver(Page):
     def __init__(self, screen: Screen, tasks: dict):
         super().__init__(screen, tasks)
-        
+        self.player = AnimationPlayer(screen, default_screensaver())
+        screen.add_player(self.player)
+
     def draw_frame(self):
-        x = 10
-        self.screen.draw.rectangle(((0, 0), (240, 240)), fill=(255, 255, 255))
-        self.screen.disp.image(self.screen.image)
-        time.sleep(0.5)
-        self.screen.draw.rectangle(((0, 0), (240, 240)), fill=(255, 0, 0))
-        self.screen.disp.image(self.screen.image)
-        time.sleep(0.1)
-        self.screen.draw.rectangle(((0, 0), (240, 240)), fill=(0, 255, 0))
-        self.screen.disp.image(self.screen.image)
-        time.sleep(0.1)
-        self.screen.draw.rectangle(((0, 0), (240, 240)), fill=(0, 0, 255))
-        self.screen.disp.image(self.screen.image)
-        time.sleep(0.1)
-        for i in range(15):
-            self.screen.draw.ellipse((120 - x, 120 - x, 120 + x, 120 + x), fill='white', outline='red')
-            self.screen.disp.image(self.screen.image)
-            x = int(x ** 1.1)
-        for i in range(50):
-            for j in range(240):
-                brightness = int((math.sin((i + j) / (12 * math.pi / 240)) + 1) * (255 / 4))
-                self.screen.draw.rectangle(((j, 0), (j + 1, 240)), fill=(brightness, brightness, brightness))
-        self.screen.disp.image(self.screen.image)
+        self.player.play()
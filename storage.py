@@ -0,0 +1,371 @@
+import math
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# one record on disk: uint32 unix timestamp, float32 value, uint32 crc32 over the first 8 bytes
+RECORD_STRUCT = struct.Struct("<IfI")
+PAYLOAD_STRUCT = struct.Struct("<If")
+RECORD_SIZE = RECORD_STRUCT.size
+RECORD_DTYPE = np.dtype([("timestamp", "<u4"), ("value", "<f4"), ("crc", "<u4")])
+# records at the end of the log that are checked on startup, a write can only be torn at the end of the file
+RECOVERY_TAIL = 64
+
+
+class MeasurementLog:
+    """
+    Append-only binary log of (timestamp, value) records.
+
+    Every sample costs one fixed size write. Records carry their own CRC, so a torn or corrupted tail
+    (e.g. power loss during a write) is detected on startup and cut off instead of breaking the whole history.
+    The log is compacted to the newest `keep` records once it grows beyond `compact_threshold` records.
+    """
+
+    def __init__(self, path: str, keep: int, compact_threshold: int = None):
+        self.path = path
+        self.keep = keep
+        self.compact_threshold = compact_threshold if compact_threshold is not None else 2 * keep
+        self.record_count = self._recover()
+        self._file = open(self.path, "ab")
+
+    def _recover(self):
+        # drop everything from the first incomplete or corrupted record of the tail on,
+        # so startup costs the same for a day of history as for a year
+        if not os.path.isfile(self.path):
+            return 0
+        complete = os.path.getsize(self.path) // RECORD_SIZE
+        valid = max(complete - RECOVERY_TAIL, 0)
+        with open(self.path, "rb") as f:
+            f.seek(valid * RECORD_SIZE)
+            data = f.read((complete - valid) * RECORD_SIZE)
+        for offset in range(0, len(data), RECORD_SIZE):
+            if zlib.crc32(data[offset:offset + PAYLOAD_STRUCT.size]) != RECORD_STRUCT.unpack_from(data, offset)[2]:
+                break
+            valid += 1
+        valid_bytes = valid * RECORD_SIZE
+        if valid_bytes != os.path.getsize(self.path):
+            print(f"Truncating corrupted measurement log {self.path} to {valid_bytes // RECORD_SIZE} records")
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return valid_bytes // RECORD_SIZE
+
+    @staticmethod
+    def _encode(timestamp, value):
+        payload = PAYLOAD_STRUCT.pack(int(timestamp), value)
+        return payload + struct.pack("<I", zlib.crc32(payload))
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self._file.write(self._encode(timestamp, value))
+        self._file.flush()
+        self.record_count += 1
+        if self.record_count > self.compact_threshold:
+            self.compact()
+
+    def extend(self, records):
+        """Appends (timestamp, value) records with a single write, e.g. an import of existing history."""
+        records = list(records)
+        self._file.write(b"".join(self._encode(timestamp, value) for timestamp, value in records))
+        self._file.flush()
+        self.record_count += len(records)
+        if self.record_count > self.compact_threshold:
+            self.compact()
+
+    def _read_bytes(self, last):
+        if last is None:
+            last = self.keep
+        last = min(last, self.record_count)
+        if last <= 0:
+            return b""
+        with open(self.path, "rb") as f:
+            f.seek((self.record_count - last) * RECORD_SIZE)
+            return f.read(last * RECORD_SIZE)
+
+    def read(self, last: int = None):
+        """Returns the newest `last` (default: `keep`) records as a list of (timestamp, value) tuples."""
+        return [(timestamp, value) for timestamp, value, _ in RECORD_STRUCT.iter_unpack(self._read_bytes(last))]
+
+    def read_arrays(self, last: int = None):
+        """Like read(), as (timestamps, values) arrays, without a Python object per record."""
+        records = np.frombuffer(self._read_bytes(last), dtype=RECORD_DTYPE)
+        return records["timestamp"], records["value"]
+
+    def compact(self):
+        # rewrite the newest records into a temporary file and atomically swap it in,
+        # so a crash during compaction leaves either the old or the new log behind
+        records = self.read(self.keep)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(self._encode(timestamp, value) for timestamp, value in records))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+        self.record_count = len(records)
+
+    def close(self):
+        self._file.close()
+
+
+RING_MAGIC = 0x52494E47  # "RING"
+RING_HEADER_FIELDS = 4  # magic, capacity, write position, count
+
+
+class RingBuffer:
+    """
+    Fixed capacity ring buffer of float32 values and uint32 timestamps, backed by a memory mapped file.
+
+    Every slot is stored twice (at `i` and `i + capacity`), so the newest `count` samples always form one contiguous
+    window of the arrays and `values()` / `timestamps()` can hand out views without copying or reordering.
+    Opening an existing file only maps it, check_against() then verifies it against the measurement log.
+    """
+
+    def __init__(self, path: str, capacity: int, retention: int = None, buffer=None):
+        self.path = path
+        self.capacity = capacity
+        # samples older than `retention` seconds (relative to the newest one) are hidden from all views
+        self.retention = retention
+        header_size = RING_HEADER_FIELDS * 4
+        if buffer is not None:
+            # same layout on top of a memory block instead of a file, e.g. multiprocessing.shared_memory
+            self._header = np.ndarray((RING_HEADER_FIELDS,), dtype=np.uint32, buffer=buffer)
+            self._values = np.ndarray((2 * capacity,), dtype=np.float32, buffer=buffer, offset=header_size)
+            self._timestamps = np.ndarray((2 * capacity,), dtype=np.uint32, buffer=buffer,
+                                          offset=header_size + 2 * capacity * 4)
+            self.created = not (self._header[0] == RING_MAGIC and self._header[1] == capacity)
+            if self.created:
+                self._header[:] = (RING_MAGIC, capacity, 0, 0)
+            return
+        file_size = self.size(capacity)
+        self.created = not self._is_valid_file(file_size)
+        mode = "w+" if self.created else "r+"
+        self._header = np.memmap(path, dtype=np.uint32, mode=mode, shape=(RING_HEADER_FIELDS,))
+        self._values = np.memmap(path, dtype=np.float32, mode="r+", offset=header_size, shape=(2 * capacity,))
+        self._timestamps = np.memmap(path, dtype=np.uint32, mode="r+", offset=header_size + 2 * capacity * 4,
+                                     shape=(2 * capacity,))
+        if self.created:
+            self._header[:] = (RING_MAGIC, capacity, 0, 0)
+            self._header.flush()
+
+    @staticmethod
+    def size(capacity):
+        """Bytes of the file (or buffer) holding `capacity` samples."""
+        return RING_HEADER_FIELDS * 4 + 2 * capacity * 4 + 2 * capacity * 4
+
+    def _is_valid_file(self, file_size):
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) != file_size:
+            return False
+        magic, capacity, write_pos, count = np.fromfile(self.path, dtype=np.uint32, count=RING_HEADER_FIELDS)
+        return magic == RING_MAGIC and capacity == self.capacity and write_pos < capacity and count <= capacity
+
+    def __len__(self):
+        start, end = self._window()
+        return end - start
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        write_pos = int(self._header[2])
+        self._values[write_pos] = self._values[write_pos + self.capacity] = value
+        self._timestamps[write_pos] = self._timestamps[write_pos + self.capacity] = int(timestamp)
+        # the memory map is written back by the kernel in no particular order, after a power cut the header can
+        # be newer than the slots it points to: check_against() at startup catches that
+        self._header[2] = (write_pos + 1) % self.capacity
+        self._header[3] = min(int(self._header[3]) + 1, self.capacity)
+
+    def clear(self):
+        self._header[2] = self._header[3] = 0
+
+    def check_against(self, log):
+        """
+        True if the window matches the MeasurementLog `log` in count and newest samples and its timestamps are
+        ascending. Only the tail of the log is read, cost is one pass over the timestamps.
+        """
+        count = int(self._header[3])
+        if count != min(log.record_count, self.capacity):
+            return False
+        if count == 0:
+            return True
+        end = (int(self._header[2]) - count) % self.capacity + count
+        timestamps = self._timestamps[end - count:end]
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            return False
+        expected_timestamps, expected_values = log.read_arrays(min(count, 64))
+        values = self._values[end - len(expected_values):end]
+        return bool(np.array_equal(timestamps[-len(expected_timestamps):], expected_timestamps) and
+                    np.all((values == expected_values) | (np.isnan(values) & np.isnan(expected_values))))
+
+    def extend(self, records):
+        records = list(records)
+        if records:
+            timestamps, values = zip(*records)
+            self.extend_arrays(np.array(timestamps), np.array(values))
+
+    def extend_arrays(self, timestamps, values):
+        # bulk append, only the newest `capacity` samples can survive anyway
+        timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+        write_pos = int(self._header[2])
+        slots = (write_pos + np.arange(len(values))) % self.capacity
+        for offset in (0, self.capacity):
+            self._values[slots + offset] = values
+            self._timestamps[slots + offset] = timestamps
+        self._header[2] = (write_pos + len(values)) % self.capacity
+        self._header[3] = min(int(self._header[3]) + len(values), self.capacity)
+
+    def _window(self):
+        count = int(self._header[3])
+        start = (int(self._header[2]) - count) % self.capacity
+        end = start + count
+        if self.retention is not None and count > 0:
+            # timestamps are ascending, so the cut-off is a binary search instead of a scan
+            cutoff = int(self._timestamps[end - 1]) - self.retention
+            start += int(np.searchsorted(self._timestamps[start:end], cutoff, side="left"))
+        return start, end
+
+    def values(self):
+        start, end = self._window()
+        return self._values[start:end]
+
+    def timestamps(self):
+        start, end = self._window()
+        return self._timestamps[start:end]
+
+    def views(self, reserve=0):
+        """
+        (timestamps, values) views that stay unchanged during the next `reserve` appends: once the buffer is full,
+        appends overwrite the oldest samples of the window, so these are left out of the views.
+        """
+        start, end = self._window()
+        count = int(self._header[3])
+        overwritten = count + reserve - self.capacity
+        if overwritten > 0:
+            start = max(start, min(end - count + overwritten, end))
+        return self._timestamps[start:end], self._values[start:end]
+
+    def coverage(self):
+        """Seconds between the oldest and the newest retained sample."""
+        start, end = self._window()
+        if end - start < 2:
+            return 0
+        return int(self._timestamps[end - 1]) - int(self._timestamps[start])
+
+    def flush(self):
+        if not isinstance(self._header, np.memmap):
+            return
+        self._header.flush()
+        self._values.flush()
+        self._timestamps.flush()
+
+
+class AggregatePyramid:
+    """
+    Min/max/mean per time bucket on several resolutions (by default 1 min, 10 min and 1 h).
+
+    Buckets are updated incrementally with every sample, so a plot of any window can be built from at most a few
+    hundred buckets instead of the raw history.
+    """
+
+    def __init__(self, retention: int, bucket_sizes=(60, 600, 3600)):
+        self.levels = [AggregateLevel(size, math.ceil(retention / size) + 1) for size in bucket_sizes]
+
+    def append(self, value, timestamp):
+        # missing measurements (nan) stay in the raw history but must not poison min/max/mean
+        if math.isnan(value):
+            return
+        for level in self.levels:
+            level.append(value, timestamp)
+
+    def rebuild(self, timestamps, values):
+        valid = ~np.isnan(values)
+        if not valid.all():
+            timestamps, values = timestamps[valid], values[valid]
+        for level in self.levels:
+            level.rebuild(timestamps, values)
+
+    def query(self, duration, points):
+        """
+        Returns (timestamps, means, mins, maxs) of the last `duration` seconds with at most `points` entries.
+        The coarsest level that still has `points` buckets in the window is used and merged down to `points`,
+        so the work is bounded by points times the ratio between two levels, independent of the history length.
+        """
+        level = self.levels[0]
+        for candidate in reversed(self.levels):
+            if duration / candidate.bucket_size >= points:
+                level = candidate
+                break
+        return level.query(duration, points)
+
+
+class AggregateLevel:
+    def __init__(self, bucket_size: int, capacity: int):
+        self.bucket_size = bucket_size
+        self.capacity = capacity
+        self.starts = np.zeros(capacity, dtype=np.int64)
+        self.mins = np.zeros(capacity, dtype=np.float32)
+        self.maxs = np.zeros(capacity, dtype=np.float32)
+        self.sums = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.uint32)
+        self.write_pos = 0  # slot of the next bucket
+        self.count = 0
+
+    def append(self, value, timestamp):
+        bucket_start = int(timestamp) - int(timestamp) % self.bucket_size
+        current = (self.write_pos - 1) % self.capacity
+        if self.count > 0 and self.starts[current] == bucket_start:
+            self.mins[current] = min(self.mins[current], value)
+            self.maxs[current] = max(self.maxs[current], value)
+            self.sums[current] += value
+            self.counts[current] += 1
+            return
+        slot = self.write_pos
+        self.starts[slot] = bucket_start
+        self.mins[slot] = self.maxs[slot] = self.sums[slot] = value
+        self.counts[slot] = 1
+        self.write_pos = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def rebuild(self, timestamps, values):
+        self.write_pos = self.count = 0
+        if len(timestamps) == 0:
+            return
+        bucket_starts = timestamps.astype(np.int64) - timestamps.astype(np.int64) % self.bucket_size
+        # a bucket is a run of equal bucket starts, like append() does it (robust against clock jumps)
+        first_indices = np.concatenate(([0], np.flatnonzero(np.diff(bucket_starts)) + 1))
+        first_indices = first_indices[-self.capacity:]
+        starts = bucket_starts[first_indices]
+        values = values[first_indices[0]:]
+        first_indices = first_indices - first_indices[0]
+        n = len(starts)
+        self.starts[:n] = starts
+        self.mins[:n] = np.minimum.reduceat(values, first_indices)
+        self.maxs[:n] = np.maximum.reduceat(values, first_indices)
+        self.sums[:n] = np.add.reduceat(values.astype(np.float64), first_indices)
+        self.counts[:n] = np.diff(np.append(first_indices, len(values)))
+        self.write_pos = n % self.capacity
+        self.count = n
+
+    def query(self, duration, points):
+        if self.count == 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return np.zeros(0, dtype=np.int64), empty, empty, empty
+        newest = (self.write_pos - 1) % self.capacity
+        wanted = min(self.count, int(duration // self.bucket_size) + 1)
+        indices = (self.write_pos - wanted + np.arange(wanted)) % self.capacity
+        # buckets might be missing (sensor offline), so cut at the actual window start
+        indices = indices[self.starts[indices] > self.starts[newest] - duration]
+        starts, mins, maxs = self.starts[indices], self.mins[indices], self.maxs[indices]
+        sums, counts = self.sums[indices], self.counts[indices]
+        if len(indices) > points:
+            # merge neighbouring buckets down to the requested resolution
+            edges = np.linspace(0, len(indices), points + 1).astype(np.int64)[:-1]
+            starts = starts[edges]
+            mins = np.minimum.reduceat(mins, edges)
+            maxs = np.maximum.reduceat(maxs, edges)
+            sums = np.add.reduceat(sums, edges)
+            counts = np.add.reduceat(counts, edges)
+        return starts, (sums / counts).astype(np.float32), mins, maxs
@@ -1,267 +1,508 @@
-import ctypes
+import math
 import os
 import pickle
 import threading
 import time
-from collections import deque
-import mh_z19
-import Adafruit_DHT
-import RPi.GPIO as GPIO
-import matplotlib.pyplot as plt
-from PIL import Image, ImageDraw, ImageFont
-import io
+from collections import deque, namedtuple
+import numpy as np
 from ping3 import ping
 
-from PAJ7620U2 import PAJ7620U2
-
-
-class StoppableThread(threading.Thread):
-    def __init__(self, target):
-        threading.Thread.__init__(self, target=target)
-
-    def get_id(self):
-        # returns id of the respective thread
-        if hasattr(self, '_thread_id'):
-            return self._thread_id
-        for id, thread in threading._active.items():
-            if thread is self:
-                return id
-
-    def raise_exception(self):
-        thread_id = self.get_id()
-        res = ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id,
-                                                         ctypes.py_object(SystemExit))
-        if res > 1:
-            ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, 0)
-            print('Exception raise failure')
+from channels import CO2, HUMIDITY, TEMPERATURE, ChannelPipeline
+from dsp import StreamStats
+from hardware import create_co2_sensor, create_temp_hum_sensor, create_gesture_sensor, create_gesture_interrupt
+from metrics import registry
+from plotting import SparklineRenderer
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, SensorReadError, call_with_retry, \
+    is_missing
+from storage import MeasurementLog, RingBuffer, AggregatePyramid
+
+# series views of a snapshot stay valid for this many further appends (see RingBuffer.views)
+SNAPSHOT_RESERVE = 16
+EMPTY_SERIES = np.zeros(0, dtype=np.float32)
+EMPTY_SERIES.setflags(write=False)
+
+
+class Snapshot(namedtuple("Snapshot", ["value", "timestamp", "sequence", "timestamps", "values", "trend", "slope",
+                                       "spike", "minimum", "maximum"], defaults=(None, None, False, None, None))):
+    """
+    Immutable state of a task, replaced as a whole with every new measurement (one attribute assignment), so other
+    threads read task.snapshot once and use it without locks. timestamps and values are views of the stored series,
+    not copies, they stay unchanged for the next SNAPSHOT_RESERVE measurements.
+    trend, slope (per minute), spike and minimum/maximum over the trend window come from the signal stage of
+    sensor channels.
+    """
+    __slots__ = ()
+
+    def coverage(self):
+        """Seconds between the oldest and the newest sample of the series."""
+        return int(self.timestamps[-1]) - int(self.timestamps[0]) if len(self.timestamps) > 1 else 0
 
 
 class Task:
-    def __init__(self, deque_max_length: int, name: str, sleep_time=5):
+    def __init__(self, retention: int, name: str, sleep_time=5):
+        # retention: how many seconds of measurements are kept, 0 disables the storage
         self.sleep_time = sleep_time
-        if os.path.isfile(f"deque_store_{name}.pickle"):
-            with open(f"deque_store_{name}.pickle", "rb") as f:
-                try:
-                    self.rolling_measurement_storage = pickle.load(f)
-                except:
-                    os.remove(f"deque_store_{name}.pickle")
-                    self.rolling_measurement_storage = deque(maxlen=deque_max_length)
-                # TODO EOFError when pickle file is corrupted, catch!
-        else:
-            self.rolling_measurement_storage = deque(maxlen=deque_max_length)
+        self.retention = retention
+        self.rolling_measurement_storage = deque(maxlen=0)
+        self.measurement_log = None
+        self.aggregates = None
+        if retention > 0:
+            # one slot per expected sample, reads take some time on top of sleep_time so this never runs short
+            capacity = math.ceil(retention / sleep_time) + 1
+            self.measurement_log = MeasurementLog(f"measurement_log_{name}.bin", keep=capacity)
+            self.import_legacy_pickle(f"deque_store_{name}.pickle")
+            self.rolling_measurement_storage = RingBuffer(f"ring_{name}.dat", capacity=capacity, retention=retention)
+            if self.rolling_measurement_storage.created or \
+                    not self.rolling_measurement_storage.check_against(self.measurement_log):
+                # the ring buffer file is missing, does not match the capacity or lost pages in a power cut,
+                # rebuild it from the log, which has a crc per record
+                if not self.rolling_measurement_storage.created:
+                    print(f"ring_{name}.dat does not match the measurement log, rebuilding it")
+                self.rolling_measurement_storage.clear()
+                self.rolling_measurement_storage.extend_arrays(*self.measurement_log.read_arrays())
+            self.aggregates = AggregatePyramid(retention)
+            self.aggregates.rebuild(self.rolling_measurement_storage.timestamps(),
+                                    self.rolling_measurement_storage.values())
         self.name = name
-        self.most_recent_measurement = -1
+        # None until the first successful read and whenever the last read failed
+        self.most_recent_measurement = None
         self.thread = None
-
-    def start_background_thread(self):
-        self.thread = StoppableThread(target=self.read_loop)
+        # set by AsyncScheduler, read() is then driven by its event loop instead of an own thread
+        self.scheduled = False
+        # what runs the task if it has no thread of its own: the AsyncScheduler, or the source feeding a SensorTask
+        self.driver = None
+        # lifecycle: the thread runs while _running is set and exits once _stop is set
+        self._stop = threading.Event()
+        self._running = threading.Event()
+        self.loop_count = 0
+        self.last_loop_time = None
+        self.last_error = None
+        labels = {"task": name}
+        self.read_time = registry.histogram("task_read_seconds", "Duration of one read() of a task", labels)
+        self.read_failures = registry.counter("task_read_failures_total", "Failed reads of a task", labels)
+        self.persistence_time = registry.histogram("task_persistence_seconds", "Duration of storing one measurement",
+                                                   labels)
+        registry.gauge("task_alive", "1 if the thread, scheduler or source running the task is alive", labels,
+                       function=lambda: int(self.is_alive()))
+        registry.gauge("task_seconds_since_last_loop", "Seconds since the task finished its last read", labels,
+                       function=lambda: -1 if self.last_loop_time is None else time.time() - self.last_loop_time)
+        # sequence is increased with every new measurement, consumers wait on the condition or subscribe
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.subscribers = []
+        # odd while store_measurement runs, see read_consistent
+        self.version = 0
+        self.snapshot = Snapshot(None, None, 0, *self._series())
+
+    def import_legacy_pickle(self, path):
+        # one time migration of the pickled deques written by older versions
+        if not os.path.isfile(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                legacy_storage = pickle.load(f)
+            # the deques held no timestamps, the samples were taken every sleep_time seconds up to now
+            now = time.time()
+            legacy_storage = list(legacy_storage)
+            for i, value in enumerate(legacy_storage):
+                self.measurement_log.append(value, timestamp=now - (len(legacy_storage) - 1 - i) * self.sleep_time)
+        except Exception:
+            print(f"Could not import {path}, skipping")
+        os.remove(path)
+
+    def store_measurement(self, measurement, timestamp=None):
+        with self.persistence_time.time():
+            if timestamp is None:
+                timestamp = time.time()
+            self.version += 1
+            try:
+                self.rolling_measurement_storage.append(measurement, timestamp=timestamp)
+                self.measurement_log.append(measurement, timestamp=timestamp)
+                self.aggregates.append(measurement, timestamp)
+            finally:
+                self.version += 1
+
+    def read_consistent(self, function, attempts=5):
+        """
+        Seqlock style read of the storage from another thread: function() is repeated until no store_measurement
+        overlapped it. After `attempts` overlapping writes the last result is returned anyway.
+        """
+        for _ in range(attempts):
+            version = self.version
+            if version % 2 == 0:
+                result = function()
+                if self.version == version:
+                    return result
+            else:
+                time.sleep(0.001)
+        return function()
+
+    def query_history(self, duration, points):
+        """
+        Returns (timestamps, means, mins, maxs) covering the last `duration` seconds with at most `points` entries.
+        Raw samples (views of the current snapshot) are used as long as they fit, otherwise the aggregates.
+        """
+        snapshot = self.snapshot
+        timestamps, values = snapshot.timestamps, snapshot.values
+        if len(timestamps) > 0:
+            first = np.searchsorted(timestamps, int(timestamps[-1]) - duration, side="right")
+            if len(timestamps) - first <= points:
+                return timestamps[first:], values[first:], values[first:], values[first:]
+        return self.read_consistent(lambda: self.aggregates.query(duration, points))
+
+    def _series(self):
+        if self.retention > 0:
+            return self.rolling_measurement_storage.views(SNAPSHOT_RESERVE)
+        return EMPTY_SERIES, EMPTY_SERIES
+
+    def subscribe(self, callback):
+        # callback(task) is called from the producing thread, keep it short
+        self.subscribers.append(callback)
+
+    def publish(self, value, timestamp=None, **stats):
+        """Swaps in a new snapshot with `value` and wakes up all consumers. Only called by the producing thread."""
+        timestamps, values = self._series()
+        with self.condition:
+            self.sequence += 1
+            self.snapshot = Snapshot(value, timestamp if timestamp is not None else time.time(), self.sequence,
+                                     timestamps, values, **stats)
+            self.condition.notify_all()
+        for callback in self.subscribers:
+            callback(self)
+
+    def wait_for_new_measurement(self, last_sequence, timeout=None, stop_event=None):
+        """
+        Blocks until sequence differs from last_sequence, stop_event is set or timeout passed.
+        Returns the current sequence.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.sequence != last_sequence or (stop_event is not None and stop_event.is_set()),
+                timeout=timeout)
+            return self.sequence
+
+    def start(self):
+        if self.scheduled:
+            self._stop.clear()
+            self._running.set()
+            return
+        if self.thread is not None and self.thread.is_alive():
+            self.resume()
+            return
+        self._stop.clear()
+        self._running.set()
+        self.thread = threading.Thread(target=self.read_loop, name=self.name, daemon=True)
         self.thread.start()
 
-    def stop_background_thread(self):
-        if self.thread is not None:
-            self.thread.raise_exception()
-            self.thread.join()
+    def pause(self):
+        # takes effect after the current read / wait, the thread then blocks without using any cpu
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def stop(self, timeout=5):
+        """Asks the thread to finish and waits up to timeout seconds, returns True if it has finished."""
+        self._stop.set()
+        self._running.set()
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def is_paused(self):
+        # tasks fed by a source have no loop of their own, they are paused when the source is. Under the scheduler
+        # (no is_paused) pause() and resume() of the task itself still apply
+        if hasattr(self.driver, "is_paused"):
+            return self.driver.is_paused()
+        return not self._running.is_set()
+
+    def is_alive(self):
+        if self.driver is not None:
+            return self.driver.is_alive()
+        return self.thread is not None and self.thread.is_alive()
+
+    def health(self):
+        return {
+            "name": self.name,
+            "alive": self.is_alive(),
+            "paused": self.is_paused(),
+            "loop_count": self.loop_count,
+            "seconds_since_last_loop": None if self.last_loop_time is None else time.time() - self.last_loop_time,
+            "last_error": self.last_error,
+        }
+
+    def _wait_while_paused(self):
+        # returns False when the task should stop
+        self._running.wait()
+        return not self._stop.is_set()
+
+    def _run_once(self):
+        try:
+            with self.read_time.time():
+                self.read()
+        except Exception as e:
+            self.last_error = repr(e)
+            self.read_failures.inc()
+            print(f"{self.name}: read failed with {self.last_error}")
+        self.loop_count += 1
+        self.last_loop_time = time.time()
 
     def read(self):
         pass
 
     def read_loop(self):
-        while True:
-            self.read()
-            time.sleep(self.sleep_time)
-
-
-class CO2ReaderTask(Task):
-    def __init__(self, deque_max_length, sleep_time=5):
-        super().__init__(deque_max_length, "co2", sleep_time=sleep_time)
-        # TODO catch a failing co2 read#
-        # counter is to distinguish if a new measurement arrived
-        self.counter = 0
-        self.startup_counter = 5
-
-        self.start_background_thread()
-
-    def save_measurement(self, measurement):
-        self.most_recent_measurement = measurement
-        if self.startup_counter > 0:
-            self.startup_counter -= 1
-        else:
-            self.rolling_measurement_storage.append(measurement)
-        with open(f"deque_store_{self.name}.pickle", "wb") as f:
-            pickle.dump(self.rolling_measurement_storage, f, pickle.HIGHEST_PROTOCOL)
-        self.counter += 1
-        self.counter = self.counter % 50
+        while self._wait_while_paused():
+            self._run_once()
+            # interruptible sleep, stop() ends it right away
+            self._stop.wait(self.sleep_time)
+
+
+class SensorTask(Task):
+    """Stores and publishes the values of one channel. Fed by its SensorSource, it has no thread of its own."""
+
+    def __init__(self, channel, sleep_time=5, history=None):
+        super().__init__(channel.retention, channel.name, sleep_time=sleep_time)
+        self.channel = channel
+        self.scheduled = True
+        # long term HistoryStore, started with the records of the measurement log on first use
+        self.history = history
+        if history is not None and history.is_empty(channel.name):
+            history.import_records(channel.name, self.measurement_log.read())
+        # ema, slope, rolling min/max and spike flag, primed with the stored samples of the last trend window
+        self.stats = StreamStats(window=channel.trend_window, spike_sigma=channel.spike_sigma)
+        storage = self.rolling_measurement_storage
+        if len(storage) > 0:
+            timestamps, values = storage.timestamps(), storage.values()
+            first = np.searchsorted(timestamps, int(timestamps[-1]) - channel.trend_window, side="right")
+            for timestamp, value in zip(timestamps[first:].tolist(), values[first:].tolist()):
+                self.stats.update(value, timestamp)
+            self.snapshot = self.snapshot._replace(trend=self.stats.trend(channel.flat_slope),
+                                                   slope=self.stats.slope_per_minute, minimum=self.stats.minimum,
+                                                   maximum=self.stats.maximum)
+
+    def store_measurement(self, measurement, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        super().store_measurement(measurement, timestamp)
+        if self.history is not None:
+            self.history.append(self.name, measurement, timestamp)
+
+    def save_measurement(self, measurement, timestamp=None, store=True):
+        self.most_recent_measurement = None if is_missing(measurement) else measurement
+        if store:
+            if timestamp is None:
+                timestamp = time.time()
+            self.store_measurement(measurement, timestamp)
+            self.stats.update(measurement, timestamp)
+        self.publish(self.most_recent_measurement, timestamp, trend=self.stats.trend(self.channel.flat_slope),
+                     slope=self.stats.slope_per_minute, spike=self.stats.spike, minimum=self.stats.minimum,
+                     maximum=self.stats.maximum)
+
+
+class Reading(namedtuple("Reading", ["timestamp", "values"])):
+    """One read of a source, values maps channel names to values (nan if the read failed)."""
+    __slots__ = ()
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+
+class SensorSource(Task):
+    """
+    Reads one physical sensor every `sleep_time` seconds and feeds its channels: each read passes the shared
+    ChannelPipeline stages once for all channels and is then stored by one SensorTask per channel (`tasks`).
+    `read` returns the values in the order of `channels` (a plain value for a single channel) or None.
+    """
+
+    def __init__(self, name, read, channels, sleep_time=5, retry_policy=None, history=None):
+        super().__init__(0, name, sleep_time=sleep_time)
+        self.sensor_read = read
+        self.channels = channels
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breaker = CircuitBreaker(name)
+        self.pipeline = ChannelPipeline(channels)
+        # the latest Reading, None until the first read finished
+        self.reading = None
+        self.tasks = {channel.name: SensorTask(channel, sleep_time=sleep_time, history=history) for channel in channels}
+        for task in self.tasks.values():
+            task.driver = self
+        registry.gauge("sensor_reading_age_seconds", "Seconds since the last reading of a sensor", {"sensor": name},
+                       function=lambda: -1 if self.reading is None else self.reading.age)
 
     def read(self):
         try:
-            measurement = mh_z19.read()['co2']
-            self.save_measurement(measurement)
-        except TypeError:
-            measurement = mh_z19.read_from_pwm()['co2']
-            self.save_measurement(measurement)
-
-
-class TemperatureHumiditySensor:
-    def __init__(self, sleep_time=5):
-        self.sleep_time = sleep_time
-
-        self.sensor = Adafruit_DHT.DHT22
-        GPIO.setup(16, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        self.temperature = -1
-        self.humidity = -1
-        self.thread = None
-
-        self.start_background_thread()
-
-    def make_measurements(self):
-        while True:
-            self.humidity, self.temperature = Adafruit_DHT.read_retry(self.sensor, 16)
-            time.sleep(self.sleep_time)
-
-    def read_sensor(self):
-        return self.humidity, self.temperature
-
-    def start_background_thread(self):
-        self.thread = threading.Thread(target=self.make_measurements)
-        self.thread.start()
-
-
-class TemperatureReaderTask(Task):
-    def __init__(self, deque_max_length, temp_hum_sensor, sleep_time=5):
-        super().__init__(deque_max_length, "temp", sleep_time=sleep_time)
-        # TODO catch a failing temperature read
-        self.temp_hum_sensor = temp_hum_sensor
-        self.counter = 0
-        self.startup_counter = 5
-
-        self.start_background_thread()
-
-    def save_measurement(self, measurement):
-        self.most_recent_measurement = measurement
-        if self.startup_counter > 0:
-            self.startup_counter -= 1
-        else:
-            self.rolling_measurement_storage.append(measurement)
-        with open(f"deque_store_{self.name}.pickle", "wb") as f:
-            pickle.dump(self.rolling_measurement_storage, f, pickle.HIGHEST_PROTOCOL)
-        self.counter += 1
-        self.counter = self.counter % 50
-
-    def read(self):
-        _, temperature = self.temp_hum_sensor.read_sensor()
-        self.save_measurement(round(temperature, 1))
-
-
-class HumidityReaderTask(Task):
-    def __init__(self, deque_max_length, temp_hum_sensor, sleep_time=5):
-        super().__init__(deque_max_length, "humid", sleep_time=sleep_time)
-        # TODO catch a failing humidity read
-        self.temp_hum_sensor = temp_hum_sensor
-
-        self.counter = 0
-        self.startup_counter = 5
-
-        self.start_background_thread()
-
-    def save_measurement(self, measurement):
-        self.most_recent_measurement = measurement
-        if self.startup_counter > 0:
-            self.startup_counter -= 1
-        else:
-            self.rolling_measurement_storage.append(measurement)
-        with open(f"deque_store_{self.name}.pickle", "wb") as f:
-            pickle.dump(self.rolling_measurement_storage, f, pickle.HIGHEST_PROTOCOL)
-        self.counter += 1
-        self.counter = self.counter % 50
-
-    def read(self):
-        humidity, _ = self.temp_hum_sensor.read_sensor()
-        self.save_measurement(round(humidity, 1))
+            values = call_with_retry(self.sensor_read, self.retry_policy, self.breaker, sleep=self._stop.wait)
+            if not isinstance(values, tuple):
+                values = (values,)
+        except (SensorReadError, CircuitOpenError):
+            self.read_failures.inc()
+            values = (None,) * len(self.channels)
+        timestamp = time.time()
+        values, store = self.pipeline.process(values)
+        values = values.tolist()
+        self.reading = Reading(timestamp, {channel.name: value for channel, value in zip(self.channels, values)})
+        # stored per channel on purpose: each channel has its own log, ring and history files with their own retention,
+        # read on their own by pages, plots and queries. At one read every 5-8s that is a few small appends, a record
+        # per source would tie the file formats to which channels share a sensor (and change with every new sensor).
+        for channel, value, keep in zip(self.channels, values, store.tolist()):
+            self.tasks[channel.name].save_measurement(value, timestamp, keep)
+        self.publish(self.reading, timestamp)
+
+
+def create_sensor_sources(co2_sensor=None, temp_hum_sensor=None, history=None):
+    co2_sensor = co2_sensor if co2_sensor is not None else create_co2_sensor()
+    temp_hum_sensor = temp_hum_sensor if temp_hum_sensor is not None else create_temp_hum_sensor()
+    return [
+        SensorSource("mh_z19", co2_sensor.read, [CO2], sleep_time=8,
+                     retry_policy=RetryPolicy(attempts=2, base_delay=1), history=history),
+        # the DHT22 must not be read more often than every 2s, so the backoff starts there
+        SensorSource("dht22", temp_hum_sensor.read, [HUMIDITY, TEMPERATURE], sleep_time=5,
+                     retry_policy=RetryPolicy(attempts=3, base_delay=2, max_delay=8), history=history),
+    ]
 
 
 class PingReaderTask(Task):
-    def __init__(self, deque_max_length: int):
-        super().__init__(deque_max_length, "ping")
-
-        self.start_background_thread()
+    def __init__(self, retention: int):
+        super().__init__(retention, "ping")
         self.most_recent_measurement = False
+        self.snapshot = self.snapshot._replace(value=False)
 
     def read(self):
         self.most_recent_measurement = isinstance(ping('192.168.1.102'), float)
+        self.publish(self.most_recent_measurement)
 
 
 class PlotBuilderTask(Task):
-    def __init__(self, deque_max_length: int, reader_task: Task, screen):
-        super().__init__(deque_max_length, "plot")
+    def __init__(self, retention: int, reader_task: Task, screen, window=24 * 3600):
+        super().__init__(retention, f"plot_{reader_task.name}")
         self.reader_task = reader_task
         self.screen = screen
-        self.semaphore = threading.Semaphore(value=1)
-        self.im = None
-
-        plt.rcParams['axes.facecolor'] = 'black'
-        plt.rcParams['axes.labelcolor'] = 'white'
-        plt.rcParams['xtick.color'] = 'white'
-        plt.rcParams['ytick.color'] = 'white'
+        self.renderer = SparklineRenderer(font=screen.font_small)
+        # the plot shows the last `window` seconds with one value per pixel column
+        self.window = window
+        self.points = self.renderer.x1 - self.renderer.x0 + 1
+
+    def rate_per_minute(self, timestamps, means):
+        # second axis: rate of change between the plotted points, lightly smoothed, O(points) not O(history)
+        if len(means) < 3:
+            return None
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.gradient(np.asarray(means, dtype=np.float64), np.asarray(timestamps, dtype=np.float64)) * 60
+        rate[~np.isfinite(rate)] = np.nan
+        if len(rate) >= 5:
+            kernel = np.ones(5) / 5
+            rate = np.convolve(rate, kernel, mode="same")
+        return rate
 
     def read(self):
-        fig, ax1 = plt.subplots(figsize=(2.4, 1.2), dpi=100, facecolor="black")
-
-        color = 'white'
-        ax1.plot(self.reader_task.rolling_measurement_storage, color=color)
-        ax1.tick_params(axis='y', labelcolor=color)
+        timestamps, means, mins, maxs = self.reader_task.query_history(self.window, self.points)
+        im = self.renderer.render(means, mins, maxs, second=self.rate_per_minute(timestamps, means))
+        # the image is never changed after publishing, pages paste it without locking
+        self.publish(im)
 
-        ax2 = ax1.twinx()  # instantiate a second axes that shares the same x-axis
-
-        color = 'tab:blue'
-        ax2.plot(self.reader_task.rolling_measurement_storage, ":", color=color)
-        ax2.tick_params(axis='y', labelcolor=color)
-        plt.gcf().subplots_adjust(left=0.2, bottom=0.04, right=0.8)
-        # fig.tight_layout()  # otherwise the right y-label is slightly clipped
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        im = Image.open(buf)
-        #buf.close()
-
-        #self.screen.disp.image(self.screen.image)
-
-        self.semaphore.acquire()
-        self.im = im
-        self.semaphore.release()
-
-        plt.close()
+    def read_loop(self):
+        # re-render only when the reader task stored something new, the first plot is rendered right away.
+        # While paused the last plot stays valid, after resume it is only re-rendered if new data arrived.
+        rendered_sequence = None
+        while self._wait_while_paused():
+            sequence = self.reader_task.sequence
+            if sequence != rendered_sequence:
+                self._run_once()
+                rendered_sequence = sequence
+            self.reader_task.wait_for_new_measurement(rendered_sequence, timeout=self.sleep_time,
+                                                      stop_event=self._stop)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        # wake up the wait on the reader task's condition
+        with self.reader_task.condition:
+            self.reader_task.condition.notify_all()
+        return super().stop(timeout)
 
 
 class GestureReaderTask(Task):
-    def __init__(self, deque_max_length, screen, sleep_time=0.05):
-        super().__init__(deque_max_length, "gesture",sleep_time=sleep_time)
+    """
+    Reads gestures either when the INT pin of the sensor signals one (`interrupt`, see hardware.GPIOInterrupt) or,
+    without the pin, by polling: every `sleep_time` seconds right after a gesture, backing off to `max_sleep_time`
+    while nothing happens. The sensor latches a gesture until it is read, so backing off delays but never loses one.
+    """
+
+    def __init__(self, retention, screen, sleep_time=0.05, sensor=None, interrupt=None, max_sleep_time=0.25,
+                 safety_interval=5):
+        super().__init__(retention, "gesture", sleep_time=sleep_time)
+        self.min_sleep_time = sleep_time
+        self.max_sleep_time = max_sleep_time
+        self.interrupt = interrupt if interrupt is not None else create_gesture_interrupt()
+        # with an interrupt, the sensor is still read every safety_interval seconds: INT stays low until the flags
+        # are read, so a single missed edge would otherwise block all further interrupts
+        self.safety_interval = safety_interval
+        self._gesture_pending = threading.Event()
 
         self.screen = screen
+        self.paj7620u2 = sensor
+        # polled at 20 Hz, so a sensor that dropped off the bus is given a rest instead of an OSError per poll
+        self.breaker = CircuitBreaker("paj7620u2", failure_threshold=20, reset_timeout=10)
         # initializing the gesture sensor sometimes doesn't work directly after startup
         # therefore, the gesture sensor has 5 attempts to initialize and 2s breaks in between.
         for i in range(5):
-            try:
-                self.paj7620u2 = PAJ7620U2()
+            if self.paj7620u2 is not None:
                 break
+            try:
+                self.paj7620u2 = create_gesture_sensor()
             except OSError:
                 time.sleep(2)
-        self.start_background_thread()
-
-    def save_measurement(self, measurement):
-        self.rolling_measurement_storage.append(measurement)
-        self.most_recent_measurement = measurement
+        if self.paj7620u2 is None:
+            # read() tries again whenever the circuit half opens
+            self.breaker.trip()
 
     def read(self):
-        gesture = self.paj7620u2.get_gesture()
-        if gesture == "Up":
-            # self.screen.enable()
-            self.screen.previous_page()
-        elif gesture == "Down":
-            # self.screen.disable()
-            self.screen.next_page()
-        elif gesture == "Right":
-            pass
-            #self.screen.next_page()
-        elif gesture == "Left":
-            pass
-            #self.screen.previous_page()
+        if not self.breaker.allow():
+            return
+        try:
+            if self.paj7620u2 is None:
+                self.paj7620u2 = create_gesture_sensor()
+            # every flagged gesture, a fast movement can set two flags in one read
+            gestures = self.paj7620u2.read_events()
+        except OSError:
+            self.breaker.record_failure()
+            self.read_failures.inc()
+            return
+        self.breaker.record_success()
+        if gestures:
+            self.sleep_time = self.min_sleep_time
+        else:
+            self.sleep_time = min(self.sleep_time * 2, self.max_sleep_time)
+        for gesture in gestures:
+            if gesture == "Up":
+                # self.screen.enable()
+                self.screen.previous_page()
+            elif gesture == "Down":
+                # self.screen.disable()
+                self.screen.next_page()
+            elif gesture == "Right":
+                pass
+                #self.screen.next_page()
+            elif gesture == "Left":
+                pass
+                #self.screen.previous_page()
+
+    def read_loop(self):
+        if self.interrupt is None:
+            super().read_loop()
+            return
+        self.interrupt.start(self._gesture_pending.set)
+        try:
+            while self._wait_while_paused():
+                # cleared before the read, an edge during the read just causes one more (empty) read
+                self._gesture_pending.clear()
+                self._run_once()
+                self._gesture_pending.wait(self.safety_interval)
+        finally:
+            self.interrupt.stop()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._gesture_pending.set()
+        return super().stop(timeout)